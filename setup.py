@@ -91,6 +91,9 @@ setup(
         "ordered-enum"
     ],
     extras_require={
+        "fast": ["orjson"],
+        "zstd": ["zstandard"],
+        "columnar": ["pyarrow"],
         # eg:
         #   'rst': ['docutils>=0.11'],
         #   ':python_version=="2.6"': ['argparse'],
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
-import json
 import pandas as pd
 import time
 import argparse
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from dnssec.probing.datatypes import *
+from dnssec.probing import output
+from dnssec.probing import codec
+from dnssec.probing import files
+from dnssec.probing import columnar
+from dnssec.probing import expiry
 from dnssec.evaluation import plot
 from enum import Enum
 from ordered_enum import OrderedEnum
@@ -63,87 +69,180 @@ def is_flapping(zone_infos):
   return state == EvalState.FLAPPING
 
 
-def to_csv(args):
-  zone_infos = []
+def evaluate_segment(segment_path, zones=None):
   domains = []
+  zone_infos = []
   algo_count = defaultdict(lambda: 0)
   digest_count = defaultdict(lambda: 0)
+  for line in files.read_lines(segment_path):
+    result = codec.decode_result(line, zones)
+    if is_flapping(result.zones):
+      result.validation_state = 'PARTIAL'
+    ext_tld = tld.extract(result.name)
+    domains.append(result.as_list()+[ext_tld])
 
-  with open(args.input, 'r') as json_file:
-    for line in json_file:
-      result = ValidationResult().from_dict(json.loads(line))
-      if is_flapping(result.zones):
-        result.validation_state = 'PARTIAL'
-      ext_tld = tld.extract(result.name)
-      domains.append(result.as_list()+[ext_tld])
-
-      for zone_info in result.zones:
-        for algo in set(zone_info.key_algos):
-          algo_count[algo] += 1
-        for digest in set(zone_info.ds_digests):
-          digest_count[digest] += 1
+    for zone_info in result.zones:
+      for algo in set(zone_info.key_algos):
+        algo_count[algo] += 1
+      for digest in set(zone_info.ds_digests):
+        digest_count[digest] += 1
+      if zones is None:
         zone_infos.append(zone_info.as_list()+[ext_tld])
+  return domains, zone_infos, dict(algo_count), dict(digest_count)
+
+
+def read_jsonl(args):
+  zone_infos = []
+  domains = []
+  algo_count = defaultdict(lambda: 0)
+  digest_count = defaultdict(lambda: 0)
+
+  zones = None
+  if args.zones:
+    # Normalized output, every zone is contained once in the zones table.
+    zones = output.read_zones(args.zones)
+    for zone_info in zones.values():
+      zone_infos.append(zone_info.as_list()+[tld.extract(zone_info.name)])
+
+  # The segments of a rotated output are independent of each other.
+  segment_paths = files.segment_paths(args.input)
+  if args.jobs > 1 and len(segment_paths) > 1:
+    with ProcessPoolExecutor(args.jobs) as pool:
+      segments = list(pool.map(evaluate_segment, segment_paths, repeat(zones)))
+  else:
+    segments = [evaluate_segment(segment_path, zones) for segment_path in segment_paths]
+
+  for segment_domains, segment_zone_infos, segment_algo_count, segment_digest_count in segments:
+    domains.extend(segment_domains)
+    zone_infos.extend(segment_zone_infos)
+    for algo, count in segment_algo_count.items():
+      algo_count[algo] += count
+    for digest, count in segment_digest_count.items():
+      digest_count[digest] += count
+
+  all_domains_df = pd.DataFrame(
+      domains, columns=ValidationResult().member_names()+['tld'])
+  all_zones_df = pd.DataFrame(
+      zone_infos, columns=ZoneInfo().member_names()+['tld'])
+  return all_domains_df, all_zones_df, algo_count, digest_count
+
+
+def read_table(table_path, columns):
+  if columnar.format_of(table_path) == 'parquet':
+    return pd.read_parquet(table_path, columns=columns, dtype_backend='numpy_nullable')
+  return pd.read_feather(table_path, columns=columns, dtype_backend='numpy_nullable')
+
+
+def read_columnar(args):
+  zone_columns = ZoneInfo().member_names()+['tld']
+  all_zones_df = read_table(args.zones or columnar.zones_path(args.input), ['id']+zone_columns)
+  all_zones_df = all_zones_df.set_index('id')
+  all_domains_df = read_table(args.input, ValidationResult().member_names()+['tld', 'zone_ids'])
 
-    algo_counts = []
-    algo_names = []
-    algo_recommendation = []
-    algo_conformity = []
-    for algo in algo_count:
-      if algorithms[algo] <= Severity.NOT_RECOMMENDED:
-        algo_conformity.append('NON_CONFORMING')
-      else:
-        algo_conformity.append('CONFORMING')
-      algo_names.append(algo)
-      algo_recommendation.append(severity_to_string(algorithms[algo]))
-      algo_counts.append(algo_count[algo])
-
-    digest_counts = []
-    digest_names = []
-    digest_recommendation = []
-    digest_conformity = []
-    for digest in digest_count:
-      if digests[digest] <= Severity.NOT_RECOMMENDED:
-        digest_conformity.append('NON_CONFORMING')
-      else:
-        digest_conformity.append('CONFORMING')
-      digest_names.append(digest)
-      digest_recommendation.append(severity_to_string(digests[digest]))
-      digest_counts.append(digest_count[digest])
-
-    algo_count_df = pd.DataFrame(
-        {'name': algo_names, 'count': algo_counts, 'recommendation': algo_recommendation, 'standard_conforming': algo_conformity})
-    algo_count_path = args.output_path+'dnskey_algorithms.csv'
-    algo_count_df.to_csv(algo_count_path, index=False)
-    print('wrote', algo_count_path)
-
-    digest_count_df = pd.DataFrame(
-        {'name': digest_names, 'count': digest_counts, 'recommendation': digest_recommendation, 'standard_conforming': digest_conformity})
-    digest_count_path = args.output_path+'ds_digests.csv'
-    digest_count_df.to_csv(digest_count_path, index=False)
-    print('wrote', digest_count_path)
-
-    all_domains_df = pd.DataFrame(
-        domains, columns=ValidationResult().member_names()+['tld'])
-    all_domains_df = all_domains_df.drop_duplicates(subset=['name'])
-    all_domains_path = args.output_path+'all_domains.csv'
-    all_domains_df.to_csv(all_domains_path, index=False)
-    print('wrote', all_domains_path)
-
-    all_zones_df = pd.DataFrame(
-        zone_infos, columns=ZoneInfo().member_names()+['tld'])
-    all_zones_df = all_zones_df.drop_duplicates(subset=['name'])
-    all_zones_path = args.output_path+'all_zones.csv'
-    all_zones_df.to_csv(all_zones_path, index=False)
-    print('wrote', all_zones_path)
+  # One row per zone of every chain, indexed by the domain.
+  chains = all_domains_df['zone_ids'].explode().dropna().astype('int64')
+  validated = pd.Series(all_zones_df['validated'].reindex(chains.values).to_numpy(dtype=bool),
+                        index=chains.index)
+  broken = (~validated).groupby(level=0).cummax()
+  flapping = (broken & validated).groupby(level=0).any()
+  flapping = flapping.reindex(all_domains_df.index, fill_value=False)
+  all_domains_df['validation_state'] = all_domains_df['validation_state'].astype(object)
+  all_domains_df.loc[flapping, 'validation_state'] = 'PARTIAL'
+
+  # Algorithms and digests are counted once per appearance of the zone.
+  appearances = chains.value_counts()
+  counts = []
+  for column in ['key_algos', 'ds_digests']:
+    values = all_zones_df[column].explode().dropna()
+    count = appearances.reindex(values.index, fill_value=0).groupby(values.to_numpy()).sum()
+    counts.append({name: int(value) for name, value in count.items() if value})
+
+  for column in ['key_algos', 'ds_digests']:
+    all_zones_df[column] = all_zones_df[column].map(list)
+  all_domains_df = all_domains_df.drop(columns='zone_ids')
+  return all_domains_df, all_zones_df.reset_index(drop=True)[zone_columns], counts[0], counts[1]
+
+
+def to_csv(args):
+  if columnar.format_of(args.input):
+    all_domains_df, all_zones_df, algo_count, digest_count = read_columnar(args)
+  else:
+    all_domains_df, all_zones_df, algo_count, digest_count = read_jsonl(args)
+
+  algo_counts = []
+  algo_names = []
+  algo_recommendation = []
+  algo_conformity = []
+  for algo in algo_count:
+    if algorithms[algo] <= Severity.NOT_RECOMMENDED:
+      algo_conformity.append('NON_CONFORMING')
+    else:
+      algo_conformity.append('CONFORMING')
+    algo_names.append(algo)
+    algo_recommendation.append(severity_to_string(algorithms[algo]))
+    algo_counts.append(algo_count[algo])
+
+  digest_counts = []
+  digest_names = []
+  digest_recommendation = []
+  digest_conformity = []
+  for digest in digest_count:
+    if digests[digest] <= Severity.NOT_RECOMMENDED:
+      digest_conformity.append('NON_CONFORMING')
+    else:
+      digest_conformity.append('CONFORMING')
+    digest_names.append(digest)
+    digest_recommendation.append(severity_to_string(digests[digest]))
+    digest_counts.append(digest_count[digest])
+
+  algo_count_df = pd.DataFrame(
+      {'name': algo_names, 'count': algo_counts, 'recommendation': algo_recommendation, 'standard_conforming': algo_conformity})
+  algo_count_path = args.output_path+'dnskey_algorithms.csv'
+  algo_count_df.to_csv(algo_count_path, index=False)
+  print('wrote', algo_count_path)
+
+  digest_count_df = pd.DataFrame(
+      {'name': digest_names, 'count': digest_counts, 'recommendation': digest_recommendation, 'standard_conforming': digest_conformity})
+  digest_count_path = args.output_path+'ds_digests.csv'
+  digest_count_df.to_csv(digest_count_path, index=False)
+  print('wrote', digest_count_path)
+
+  all_domains_df = all_domains_df.drop_duplicates(subset=['name'])
+  all_domains_path = args.output_path+'all_domains.csv'
+  all_domains_df.to_csv(all_domains_path, index=False)
+  print('wrote', all_domains_path)
+
+  all_zones_df = all_zones_df.drop_duplicates(subset=['name'])
+  all_zones_path = args.output_path+'all_zones.csv'
+  all_zones_df.to_csv(all_zones_path, index=False)
+  print('wrote', all_zones_path)
+
+
+def expiring_to_csv(args):
+  # Only the part of the index expiring within the given hours is read.
+  now = int(time.time())
+  expiring = list(expiry.read_range(args.expiry_index, now, now + int(args.expiring_within * 3600)))
+  expiring_df = pd.DataFrame(expiring, columns=['rrsig_expiration', 'name'])
+  expiring_path = args.output_path+'expiring_zones.csv'
+  expiring_df.to_csv(expiring_path, index=False)
+  print('wrote', expiring_path)
 
 
 def main():
   # action='store_true'
   parser = argparse.ArgumentParser()
   parser.add_argument(
-      '-i', '--input', help='The json that should be evaluated', metavar='INPUT_FILE')
+      '-i', '--input', help='The json, parquet or arrow output that should be evaluated, may be compressed or a segment manifest', metavar='INPUT_FILE')
+  parser.add_argument(
+      '-z', '--zones', help='The zones table written by probing --zones-output or with a columnar --format', metavar='ZONES_FILE')
   parser.add_argument(
       '-o', '--output-path', help='Path at which created files are written to', metavar='OUTPUT_PATH')
+  parser.add_argument(
+      '-j', '--jobs', help='Number of processes that read the segments of a rotated input', type=int, default=1)
+  parser.add_argument(
+      '-e', '--expiry-index', help='The index written by probing --expiry-index, lists the zones whose signatures expire soon', metavar='INDEX_FILE')
+  parser.add_argument(
+      '--expiring-within', help='Hours within which the listed signatures expire', type=float, default=24)
   parser.add_argument(
       '-p', '--plot', help='Plot the evaluated files and save them to OUTPUT_PATH', action='store_true')
 
@@ -155,7 +254,10 @@ def main():
   elif args.output_path[-1] != '/':
     args.output_path += '/'
 
-  to_csv(args)
+  if args.expiry_index:
+    expiring_to_csv(args)
+  if args.input:
+    to_csv(args)
   if args.plot:
     plot.plot(args.output_path, args.output_path)
 
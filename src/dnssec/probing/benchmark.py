@@ -0,0 +1,125 @@
+import argparse
+import json
+import time
+import dns.dnssec
+import dns.name
+import dns.rrset
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+from dnssec.probing.datatypes import *
+from dnssec.probing import codec
+from dnssec.probing import executor
+from dnssec.probing import verification
+
+
+def make_jobs(count):
+  # count signed A RRsets of a made up zone, like the SOA/DNSKEY/DS
+  # signatures of as many zones.
+  zone = dns.name.from_text('bench.')
+  private_key = rsa.generate_private_key(65537, 2048)
+  dnskey = dns.dnssec.make_dnskey(private_key.public_key(), dns.dnssec.Algorithm.RSASHA256,
+                                  flags=257)
+  keys = verification.index_keys(dns.rrset.from_rdata(zone, 3600, dnskey))
+  now = int(time.time())
+  jobs = []
+  for i in range(count):
+    rrset = dns.rrset.from_text(f'host{i}.bench.', 3600, 'IN', 'A', f'10.0.{i // 256 % 256}.{i % 256}')
+    rrsig = dns.rrset.from_rdata(rrset.name, 3600, dns.dnssec.sign(
+        rrset, private_key, zone, dnskey, inception=now - 3600, expiration=now + 86400))
+    jobs.append((rrset, rrsig, 'bench.', keys))
+  return jobs
+
+
+def one_by_one(verifier, jobs, inline=False):
+  # Every check is waited for before the next one, like the NSEC proofs.
+  for job in jobs:
+    assert verifier.result(verifier.verify(*job, inline=inline))
+
+
+def batched(verifier, jobs, level_size):
+  # The checks of a planner level are submitted before a single flush.
+  for start in range(0, len(jobs), level_size):
+    futures = [verifier.verify(*job) for job in jobs[start:start + level_size]]
+    verifier.flush()
+    assert all(verifier.result(future) for future in futures)
+
+
+def make_results(count):
+  # count results of a domain below a signed TLD and zone, like the output
+  # of a probing run.
+  results = []
+  for i in range(count):
+    result = ValidationResult(f'www.domain{i}.com.')
+    for name in ['com.', f'domain{i}.com.']:
+      zone_info = ZoneInfo(name)
+      zone_info.has_dnskey = zone_info.has_ds = zone_info.validated = True
+      zone_info.valid_dnskey = zone_info.valid_soa = True
+      zone_info.num_ksk, zone_info.num_zsk = 1, 1
+      zone_info.key_algos = intern_tuple(['ECDSAP256SHA256'])
+      zone_info.ds_digests = intern_tuple(['SHA256'])
+      zone_info.rrsig_inception, zone_info.rrsig_expiration = 1700000000, 1700600000
+      zone_info.min_ttl = 3600
+      result.zones.append(zone_info)
+    results.append(result)
+  return results
+
+
+def json_encode(results):
+  # The path before the codec, as_dict and the json module.
+  return [json.dumps(result.as_dict(), ensure_ascii=False) + '\n' for result in results]
+
+
+def json_decode(lines):
+  return [ValidationResult().from_dict(json.loads(line)) for line in lines]
+
+
+def measure(name, run, count, unit='verification'):
+  start = time.perf_counter()
+  run()
+  seconds = time.perf_counter() - start
+  print(f'{name:<40} {seconds / count * 1e6:8.1f} us per {unit}')
+
+
+def benchmark_codec(count):
+  results = make_results(count)
+  lines = [codec.encode_result(result) for result in results]
+  print('codec uses', codec.loads.__module__)
+  measure('encode, as_dict + json', lambda: json_encode(results), count, 'result')
+  measure('encode, codec', lambda: [codec.encode_result(result) for result in results],
+          count, 'result')
+  measure('decode, json + from_dict', lambda: json_decode(lines), count, 'result')
+  measure('decode, codec', lambda: [codec.decode_result(line) for line in lines],
+          count, 'result')
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('mode', nargs='?', choices=['executor', 'codec'], default='executor',
+                      help='Benchmark the verification executor or the JSONL codec')
+  parser.add_argument('--jobs', type=int, default=2000,
+                      help='Number of signatures that are verified')
+  parser.add_argument('--workers', type=int, default=4,
+                      help='Number of verification workers')
+  parser.add_argument('--level-size', type=int, default=500,
+                      help='Number of signatures of a planner level')
+  parser.add_argument('--results', type=int, default=20000,
+                      help='Number of results that are encoded and decoded')
+  args = parser.parse_args()
+
+  if args.mode == 'codec':
+    benchmark_codec(args.results)
+    return
+  jobs = make_jobs(args.jobs)
+  # The verification cache is not used, every signature is verified.
+  measure('inline', lambda: one_by_one(executor.VerificationExecutor(), jobs), args.jobs)
+  pool = executor.VerificationExecutor(args.workers, min_batch=1)
+  pool.result(pool.verify(*jobs[0]))
+  measure('pool, one job per batch', lambda: one_by_one(pool, jobs), args.jobs)
+  measure('pool, single checks inline', lambda: one_by_one(pool, jobs, inline=True), args.jobs)
+  measure(f'pool, levels of {args.level_size}', lambda: batched(pool, jobs, args.level_size),
+          args.jobs)
+  pool.shutdown()
+
+
+if __name__ == '__main__':
+  main()
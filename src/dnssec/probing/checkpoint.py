@@ -0,0 +1,77 @@
+import dns.name
+import dns.rrset
+import json
+import os
+
+from dnssec.probing.datatypes import *
+from dnssec.probing import verification
+from dnssec.probing import codec
+from dnssec.probing import nsec
+
+
+def cached_zone_as_dict(zone):
+  keys = zone.keys.keys.values() if zone.keys else []
+  return {'name': zone.name,
+          'ns': zone.ns,
+          'expiration': zone.expiration,
+          'refresh': zone.refresh,
+          'fingerprint': zone.keys.fingerprint.hex() if zone.keys else None,
+          'dnskey': [dnskey.to_text() for dnskeys in keys for dnskey in dnskeys],
+          # valid_ds is not part of the output, but of the scheduler keys.
+          'info': dict(codec.zone_as_dict(zone.info), valid_ds=zone.info.valid_ds)}
+
+
+def cached_zone_from_dict(dct):
+  keys = None
+  if dct['fingerprint'] is not None:
+    keys = verification.index_keys(
+        dns.rrset.from_text(dct['name'], 0, 'IN', 'DNSKEY', *dct['dnskey']))
+    # The fingerprint covers the whole DNSKEY RRset, not only the zone keys.
+    keys.fingerprint = bytes.fromhex(dct['fingerprint'])
+  return CachedZone(dct['name'], dct['ns'], keys, dct['expiration'],
+                    codec.zone_from_dict(dct['info']), dct.get('refresh'))
+
+
+def denial_as_dict(ranges, now):
+  with ranges.lock:
+    entries = [(owner, next, has_ds, expiration) for owner, (next, has_ds, expiration)
+               in zip(ranges.owners, ranges.ranges) if expiration >= now]
+  params = None
+  if ranges.params is not None:
+    salt, iterations, algorithm = ranges.params
+    params = [salt.hex(), iterations, algorithm]
+  # NSEC records contain names, NSEC3 records hashes.
+  return {'type': ranges.nsec_type,
+          'params': params,
+          'ranges': [[str(owner), str(next), has_ds, expiration]
+                     for owner, next, has_ds, expiration in entries]}
+
+
+def denial_from_dict(dct):
+  params = None
+  if dct['params'] is not None:
+    salt, iterations, algorithm = dct['params']
+    params = (bytes.fromhex(salt), iterations, algorithm)
+  ranges = nsec.DenialRanges(dct['type'], params)
+  for owner, next, has_ds, expiration in dct['ranges']:
+    if dct['type'] == 'NSEC':
+      owner, next = dns.name.from_text(owner), dns.name.from_text(next)
+    ranges.add(owner, next, has_ds, expiration)
+  return ranges
+
+
+def save(path, checkpoint):
+  # Written atomically and synced, a crash must leave the previous checkpoint.
+  tmp_path = f'{path}.{os.getpid()}'
+  with open(tmp_path, 'w') as checkpoint_file:
+    json.dump(checkpoint, checkpoint_file)
+    checkpoint_file.flush()
+    os.fsync(checkpoint_file.fileno())
+  os.replace(tmp_path, path)
+
+
+def load(path):
+  if not os.path.exists(path):
+    return None
+  with open(path, 'r') as checkpoint_file:
+    return json.load(checkpoint_file)
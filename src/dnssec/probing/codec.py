@@ -0,0 +1,95 @@
+import sys
+
+from operator import attrgetter
+from dnssec.probing.datatypes import *
+
+try:
+  import orjson
+
+  def dumps(obj):
+    return orjson.dumps(obj)
+
+  loads = orjson.loads
+except ImportError:
+  import json
+
+  def dumps(obj):
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+  loads = json.loads
+
+
+# The order of the fields matches ZoneInfo.as_dict and ValidationResult.as_dict,
+# so both paths produce the same JSONL format.
+zone_fields = ('name', 'has_dnskey', 'has_ds', 'valid_dnskey', 'valid_soa',
+               'num_ksk', 'num_zsk', 'key_algos', 'ds_digests', 'validated',
+               'nsec3_iterations', 'nsec3_hash_time', 'rrsig_inception', 'rrsig_expiration',
+               'min_ttl', 'validation_state', 'reason')
+result_fields = ('name', 'validation_state', 'reason')
+
+get_zone_fields = attrgetter(*zone_fields)
+get_result_fields = attrgetter(*result_fields)
+
+
+def zone_as_dict(zone_info):
+  return dict(zip(zone_fields, get_zone_fields(zone_info)))
+
+
+def result_as_dict(result, zone_ids=None):
+  dct = dict(zip(result_fields, get_result_fields(result)))
+  if zone_ids is None:
+    dct['zones'] = [zone_as_dict(zone_info) for zone_info in result.zones]
+  else:
+    dct['zone_ids'] = zone_ids
+  return dct
+
+
+def encode_zone(zone_info, zone_id=None):
+  dct = zone_as_dict(zone_info)
+  if zone_id is not None:
+    dct['id'] = zone_id
+  return dumps(dct) + b'\n'
+
+
+def encode_result(result, zone_ids=None):
+  return dumps(result_as_dict(result, zone_ids)) + b'\n'
+
+
+def zone_from_dict(dct):
+  zone_info = ZoneInfo.__new__(ZoneInfo)
+  zone_info.name = dct['name']
+  zone_info.has_dnskey = dct['has_dnskey']
+  zone_info.has_ds = dct['has_ds']
+  zone_info.valid_dnskey = dct['valid_dnskey']
+  zone_info.valid_soa = dct['valid_soa']
+  zone_info.valid_ds = dct.get('valid_ds', False)
+  zone_info.num_ksk = dct['num_ksk']
+  zone_info.num_zsk = dct['num_zsk']
+  zone_info.key_algos = intern_tuple(dct['key_algos'])
+  zone_info.ds_digests = intern_tuple(dct['ds_digests'])
+  zone_info.validated = dct['validated']
+  zone_info.nsec3_iterations = dct.get('nsec3_iterations')
+  zone_info.nsec3_hash_time = dct.get('nsec3_hash_time')
+  zone_info.rrsig_inception = dct.get('rrsig_inception')
+  zone_info.rrsig_expiration = dct.get('rrsig_expiration')
+  zone_info.min_ttl = dct.get('min_ttl')
+  zone_info.validation_state = sys.intern(dct['validation_state'])
+  zone_info.reason = intern_str(dct['reason'])
+  return zone_info
+
+
+def decode_zone(line):
+  return zone_from_dict(loads(line))
+
+
+def decode_result(line, zones=None):
+  dct = loads(line)
+  result = ValidationResult.__new__(ValidationResult)
+  result.name = dct['name']
+  result.validation_state = sys.intern(dct['validation_state'])
+  result.reason = intern_str(dct['reason'])
+  if 'zone_ids' in dct:
+    result.zones = [zones[zone_id] for zone_id in dct['zone_ids']]
+  else:
+    result.zones = [zone_from_dict(zone_dct) for zone_dct in dct['zones']]
+  return result
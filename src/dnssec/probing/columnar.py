@@ -0,0 +1,158 @@
+import os
+
+from dnssec.probing.datatypes import *
+from dnssec.probing import output
+from dnssec.evaluation import tld
+
+try:
+  import pyarrow
+  import pyarrow.ipc
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+
+extensions = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def require_pyarrow():
+  if pyarrow is None:
+    raise ImportError('the pyarrow package is required for parquet and arrow files')
+
+
+def format_of(path):
+  for table_format, extension in extensions.items():
+    if path.endswith(extension):
+      return table_format
+  return None
+
+
+def zones_path(path):
+  # result.parquet -> result.zones.parquet
+  base, extension = os.path.splitext(path)
+  return f'{base}.zones{extension}'
+
+
+def category():
+  # Columns with few distinct values are dictionary encoded.
+  return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+
+
+def zone_schema():
+  return pyarrow.schema([
+      ('id', pyarrow.int32()),
+      ('name', pyarrow.string()),
+      ('has_dnskey', pyarrow.bool_()),
+      ('has_ds', pyarrow.bool_()),
+      ('valid_dnskey', pyarrow.bool_()),
+      ('valid_soa', pyarrow.bool_()),
+      ('num_ksk', pyarrow.int32()),
+      ('num_zsk', pyarrow.int32()),
+      ('key_algos', pyarrow.list_(category())),
+      ('ds_digests', pyarrow.list_(category())),
+      ('validated', pyarrow.bool_()),
+      ('nsec3_iterations', pyarrow.int32()),
+      ('nsec3_hash_time', pyarrow.float64()),
+      ('rrsig_inception', pyarrow.int64()),
+      ('rrsig_expiration', pyarrow.int64()),
+      ('min_ttl', pyarrow.int64()),
+      ('validation_state', category()),
+      ('reason', category()),
+      ('tld', category())])
+
+
+def domain_schema():
+  return pyarrow.schema([
+      ('name', pyarrow.string()),
+      ('validation_state', category()),
+      ('reason', category()),
+      ('tld', category()),
+      ('zone_ids', pyarrow.list_(pyarrow.int32()))])
+
+
+class TableFile:
+  # Buffers rows column by column and writes them as one Parquet row group or
+  # Arrow record batch once row_group_size rows are buffered.
+  def __init__(self, path, schema, table_format, compression=None,
+               row_group_size=65536):
+    self.schema = schema
+    self.row_group_size = row_group_size
+    self.columns = {name: [] for name in schema.names}
+    self.rows = 0
+    self.raw = open(path, 'wb')
+    if table_format == 'parquet':
+      self.writer = pyarrow.parquet.ParquetWriter(
+          self.raw, schema, compression=compression or 'snappy')
+    else:
+      options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+      self.writer = pyarrow.ipc.new_file(self.raw, schema, options=options)
+
+  def append(self, row):
+    for column, value in zip(self.columns.values(), row):
+      column.append(value)
+    self.rows += 1
+
+  def write_rows(self):
+    if not self.rows:
+      return
+    batch = pyarrow.RecordBatch.from_pydict(self.columns, schema=self.schema)
+    self.writer.write_batch(batch)
+    for column in self.columns.values():
+      column.clear()
+    self.rows = 0
+
+  def flush(self, sync=False):
+    # Smaller row groups would only be written to be able to flush, which
+    # hurts the compression and the reading of single columns.
+    if self.rows >= self.row_group_size:
+      self.write_rows()
+    self.raw.flush()
+    if sync:
+      os.fsync(self.raw.fileno())
+
+  def close(self):
+    self.write_rows()
+    self.writer.close()
+    self.raw.close()
+
+
+class ColumnarWriter:
+  # Writes the results as a domains and a zones table in the Parquet or
+  # Arrow IPC file format. Like the normalized JSONL output, every zone is
+  # only written once and referenced by its ID from the domains.
+  def __init__(self, path, zones_output=None, table_format='parquet',
+               compression=None, row_group_size=65536):
+    require_pyarrow()
+    if table_format == 'arrow' and compression == 'gzip':
+      raise ValueError('arrow files can only be compressed with zstd')
+    self.domains = TableFile(path, domain_schema(), table_format,
+                             compression, row_group_size)
+    self.zones_file = TableFile(zones_output or zones_path(path), zone_schema(),
+                                table_format, compression, row_group_size)
+    self.zones = output.ZoneTable()
+
+  def zone_ids(self, result):
+    zone_ids = []
+    for zone_info in result.zones:
+      zone_id, is_new = self.zones.ref(zone_info)
+      if is_new:
+        self.zones_file.append([zone_id] + zone_info.as_list() +
+                               [tld.extract(zone_info.name)])
+      zone_ids.append(zone_id)
+    return zone_ids
+
+  def write(self, result):
+    self.domains.append(result.as_list() + [tld.extract(result.name),
+                                            self.zone_ids(result)])
+
+  def write_batch(self, results):
+    for result in results:
+      self.write(result)
+
+  def flush(self, sync=False):
+    self.zones_file.flush(sync)
+    self.domains.flush(sync)
+
+  def close(self):
+    self.zones_file.close()
+    self.domains.close()
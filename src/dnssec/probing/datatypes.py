@@ -1,7 +1,25 @@
+import sys
+import time
+
 from dataclasses import dataclass
+from dataclasses import field
 from dnssec.probing.exception import *
 
 
+# Contains the distinct algorithm and digest lists. Only a few dozen of them
+# exist, hence all zones share the same tuple objects.
+interned_tuples = dict()  # {tuple: tuple}
+
+
+def intern_tuple(values):
+  values = tuple(sys.intern(value) for value in values)
+  return interned_tuples.setdefault(values, values)
+
+
+def intern_str(value):
+  return None if value is None else sys.intern(value)
+
+
 @dataclass
 class Response:
   rrset: list  # dns.rrset.RRset
@@ -9,6 +27,8 @@ class Response:
 
 
 class ValidationState:
+  __slots__ = ['validation_state', 'reason']
+
   def __init__(self):
     self.validation_state = 'VALIDATED'
     self.reason = None
@@ -25,6 +45,8 @@ class ValidationState:
       self.validation_state = 'MISSING_RESSOURCE'
     elif isinstance(ex, ShouldNotHappenError):
       self.validation_state = 'WEIRD_STUFF_HAPPENED'
+    elif isinstance(ex, ZoneFileError):
+      self.validation_state = 'ZONEFILE_ERROR'
     else:
       # Any unmatched Exception is caught here. PRINT THE TYPE FOR DEBUGGING
       self.validation_state = 'OTHER'
@@ -34,8 +56,8 @@ class ValidationState:
     return {'validation_state': self.validation_state, 'reason': self.reason}
 
   def _from_dict(self, dct):
-    self.validation_state = dct['validation_state']
-    self.reason = dct['reason']
+    self.validation_state = intern_str(dct['validation_state'])
+    self.reason = intern_str(dct['reason'])
 
   def _as_list(self):
     return [self.validation_state, self.reason]
@@ -45,6 +67,11 @@ class ValidationState:
 
 
 class ZoneInfo(ValidationState):
+  __slots__ = ['name', 'has_dnskey', 'has_ds', 'valid_dnskey', 'valid_soa',
+               'valid_ds', 'num_ksk', 'num_zsk', 'key_algos', 'ds_digests',
+               'validated', 'nsec3_iterations', 'nsec3_hash_time',
+               'rrsig_inception', 'rrsig_expiration', 'min_ttl']
+
   def __init__(self, name=None):
     super().__init__()
     self.name = name
@@ -52,11 +79,30 @@ class ZoneInfo(ValidationState):
     self.has_ds = False
     self.valid_dnskey = False
     self.valid_soa = False
+    self.valid_ds = False
     self.num_ksk = 0
     self.num_zsk = 0
-    self.key_algos = []
-    self.ds_digests = []
+    self.key_algos = ()
+    self.ds_digests = ()
     self.validated = False
+    self.nsec3_iterations = None
+    self.nsec3_hash_time = None
+    # Latest inception and earliest expiration of the RRSIGs and the lowest
+    # TTL of the records the zone was validated with.
+    self.rrsig_inception = None
+    self.rrsig_expiration = None
+    self.min_ttl = None
+
+  def add_signed(self, response):
+    if response is None or response.rrset is None:
+      return
+    if self.min_ttl is None or response.rrset.ttl < self.min_ttl:
+      self.min_ttl = response.rrset.ttl
+    for rrsig in response.rrsig or []:
+      if self.rrsig_inception is None or rrsig.inception > self.rrsig_inception:
+        self.rrsig_inception = rrsig.inception
+      if self.rrsig_expiration is None or rrsig.expiration < self.rrsig_expiration:
+        self.rrsig_expiration = rrsig.expiration
 
   def __bool__(self):
     return (self.has_dnskey and
@@ -66,10 +112,10 @@ class ZoneInfo(ValidationState):
             self.validated)
 
   def __str__(self):
-    return f"ZoneInfo(name='{self.name}', validation_state='{self.validation_state}', reason='{self.reason}', has_dnskey={self.has_dnskey}, has_ds={self.has_ds}, valid_dnskey={self.valid_dnskey}, valid_soa={self.valid_soa}, num_ksk={self.num_ksk}, num_zsk={self.num_zsk}, key_algos={self.key_algos}, ds_digests={self.ds_digests}, validated={self.validated})"
+    return f"ZoneInfo(name='{self.name}', validation_state='{self.validation_state}', reason='{self.reason}', has_dnskey={self.has_dnskey}, has_ds={self.has_ds}, valid_dnskey={self.valid_dnskey}, valid_soa={self.valid_soa}, num_ksk={self.num_ksk}, num_zsk={self.num_zsk}, key_algos={self.key_algos}, ds_digests={self.ds_digests}, validated={self.validated}, nsec3_iterations={self.nsec3_iterations}, nsec3_hash_time={self.nsec3_hash_time}, rrsig_inception={self.rrsig_inception}, rrsig_expiration={self.rrsig_expiration}, min_ttl={self.min_ttl})"
 
   def __repr__(self):
-    return f'ZoneInfo({self.name}, {self.validation_state}, {self.reason}, {self.has_dnskey}, {self.has_ds}, {self.valid_dnskey}, {self.valid_soa}, {self.num_ksk}, {self.num_zsk}, {self.key_algos}, {self.ds_digests}, {self.validated})'
+    return f'ZoneInfo({self.name}, {self.validation_state}, {self.reason}, {self.has_dnskey}, {self.has_ds}, {self.valid_dnskey}, {self.valid_soa}, {self.num_ksk}, {self.num_zsk}, {self.key_algos}, {self.ds_digests}, {self.validated}, {self.nsec3_iterations}, {self.nsec3_hash_time}, {self.rrsig_inception}, {self.rrsig_expiration}, {self.min_ttl})'
 
   def as_dict(self):
     dct = {'name': self.name,
@@ -79,9 +125,14 @@ class ZoneInfo(ValidationState):
            'valid_soa': self.valid_soa,
            'num_ksk': self.num_ksk,
            'num_zsk': self.num_zsk,
-           'key_algos': self.key_algos,
-           'ds_digests': self.ds_digests,
-           'validated': self.validated}
+           'key_algos': list(self.key_algos),
+           'ds_digests': list(self.ds_digests),
+           'validated': self.validated,
+           'nsec3_iterations': self.nsec3_iterations,
+           'nsec3_hash_time': self.nsec3_hash_time,
+           'rrsig_inception': self.rrsig_inception,
+           'rrsig_expiration': self.rrsig_expiration,
+           'min_ttl': self.min_ttl}
     dct.update(super()._as_dict())
     return dct
 
@@ -94,23 +145,35 @@ class ZoneInfo(ValidationState):
     self.valid_soa = dct['valid_soa']
     self.num_ksk = dct['num_ksk']
     self.num_zsk = dct['num_zsk']
-    self.key_algos = dct['key_algos']
-    self.ds_digests = dct['ds_digests']
+    self.key_algos = intern_tuple(dct['key_algos'])
+    self.ds_digests = intern_tuple(dct['ds_digests'])
     self.validated = dct['validated']
+    # Not contained in results written by older versions.
+    self.nsec3_iterations = dct.get('nsec3_iterations')
+    self.nsec3_hash_time = dct.get('nsec3_hash_time')
+    self.rrsig_inception = dct.get('rrsig_inception')
+    self.rrsig_expiration = dct.get('rrsig_expiration')
+    self.min_ttl = dct.get('min_ttl')
     return self
 
   def as_list(self):
     return [self.name, self.has_dnskey, self.has_ds, self.valid_dnskey,
-            self.valid_soa, self.num_ksk, self.num_zsk, self.key_algos,
-            self.ds_digests, self.validated] + super()._as_list()
+            self.valid_soa, self.num_ksk, self.num_zsk, list(self.key_algos),
+            list(self.ds_digests), self.validated, self.nsec3_iterations,
+            self.nsec3_hash_time, self.rrsig_inception, self.rrsig_expiration,
+            self.min_ttl] + super()._as_list()
 
   def member_names(self):
     return [
         'name', 'has_dnskey', 'has_ds', 'valid_dnskey', 'valid_soa', 'num_ksk',
-        'num_zsk', 'key_algos', 'ds_digests', 'validated'] + super()._member_names()
+        'num_zsk', 'key_algos', 'ds_digests', 'validated', 'nsec3_iterations',
+        'nsec3_hash_time', 'rrsig_inception', 'rrsig_expiration', 'min_ttl'
+    ] + super()._member_names()
 
 
 class ValidationResult(ValidationState):
+  __slots__ = ['name', 'zones']
+
   def __init__(self, name=None):
     super().__init__()
     self.name = name
@@ -132,19 +195,28 @@ class ValidationResult(ValidationState):
   def __repr__(self):
     return f'ValidationResult({self.name}, {self.validation_state}, {self.reason}, {self.zones})'
 
-  def as_dict(self):
-    zone_dicts = []
-    for zone in self.zones:
-      zone_dicts.append(zone.as_dict())
+  def as_dict(self, zone_ids=None):
+    # With zone_ids, the zones are only referenced by their ID in a separate
+    # zones table (see dnssec.probing.output.ZoneTable).
     dct = {'name': self.name}
     dct.update(super()._as_dict())
-    dct['zones'] = zone_dicts
+    if zone_ids is None:
+      zone_dicts = []
+      for zone in self.zones:
+        zone_dicts.append(zone.as_dict())
+      dct['zones'] = zone_dicts
+    else:
+      dct['zone_ids'] = zone_ids
     return dct
 
-  def from_dict(self, dct):
+  def from_dict(self, dct, zones=None):
     super()._from_dict(dct)
-    for zone_dct in dct['zones']:
-      self.zones.append(ZoneInfo().from_dict(zone_dct))
+    if 'zone_ids' in dct:
+      for zone_id in dct['zone_ids']:
+        self.zones.append(zones[zone_id])
+    else:
+      for zone_dct in dct['zones']:
+        self.zones.append(ZoneInfo().from_dict(zone_dct))
     self.name = dct['name']
     return self
 
@@ -155,6 +227,20 @@ class ValidationResult(ValidationState):
     return ['name'] + super()._member_names()
 
 
+@dataclass
+class KeyIndex:
+  fingerprint: bytes  # SHA-256 of the canonical DNSKEY RRset
+  keys: dict  # {(int key_tag, int algorithm): [DNSKEY rdata]}
+  # The parsed public keys live as long as the zone they belong to.
+  public_keys: dict = field(default_factory=dict, repr=False, compare=False)  # {(int key_tag, bytes key): public_key}
+
+  def __getstate__(self):
+    # Public keys can not be pickled, workers parse them again.
+    state = dict(self.__dict__)
+    state['public_keys'] = dict()
+    return state
+
+
 @ dataclass
 class Zone:
   name: str
@@ -162,3 +248,29 @@ class Zone:
   ns: str
   soa: Response
   info: ZoneInfo
+  keys: KeyIndex = None
+
+
+class CachedZone:
+  # What is kept of a zone after it has been validated. The raw responses are
+  # dropped, only what is needed for validating child zones is kept.
+  __slots__ = ['name', 'ns', 'keys', 'expiration', 'info', 'refresh']
+
+  def __init__(self, name, ns, keys, expiration, info, refresh=None):
+    self.name = name
+    self.ns = ns
+    self.keys = keys
+    self.expiration = expiration
+    self.info = info
+    # When the TTL of the DNSKEY and SOA runs out.
+    self.refresh = expiration if refresh is None else refresh
+
+  @classmethod
+  def from_zone(cls, zone, info):
+    expiration = min(rrsig.expiration for rrsig in zone.dnskey.rrsig)
+    ttl = min(response.rrset.ttl for response in [zone.dnskey, zone.soa]
+              if response is not None and response.rrset is not None)
+    return cls(zone.name, zone.ns, zone.keys, expiration, info, int(time.time()) + ttl)
+
+  def __repr__(self):
+    return f'CachedZone({self.name}, {self.ns}, {self.expiration}, {self.info!r})'
@@ -6,36 +6,97 @@ import dns.resolver
 import dns.rdatatype
 import traceback
 import argparse
-import json
-import csv
+import time
+import sys
+import itertools
+import threading
 
 from tqdm import tqdm
 from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
 from dnssec.probing.exception import *
 from dnssec.probing.datatypes import *
+from dnssec.probing import verification
+from dnssec.probing import trust_anchor
+from dnssec.probing import executor
+from dnssec.probing import nsec
+from dnssec.probing import output
+from dnssec.probing import columnar
+from dnssec.probing import checkpoint
+from dnssec.probing import inputs
+from dnssec.probing import schedule
+from dnssec.probing import local_root
+from dnssec.probing import zonefile
+from dnssec.probing import codec
+from dnssec.probing import server
+from dnssec.probing import scheduler
+from dnssec.probing import expiry
+from dnssec.evaluation import tld
 
 
-# Contains zones for which the SOA record has been queried and was correct.
-existing_zones = dict()  # {str zone_name: Zone zone}
-# Contains zones for which the SOA record has been queried and was INcorrect.
-nonexisting_zones = set()  # str : zone_name
+# Contains zones for which the SOA record has been queried and was correct,
+# until its TTL runs out. The SOA is dropped (None) once the zone has been
+# validated, the entry then expires with the validated zone.
+existing_zones = dict()  # {str zone_name: (Response soa, int expiration)}
+# Contains zones for which the SOA record has been queried and was INcorrect,
+# until the negative TTL of the answer runs out (RFC 2308, Section 5).
+nonexisting_zones = dict()  # {str zone_name: int expiration}
 
 # Contains zones that have been fully validated.
-validated_zones = dict()  # {str zone_name: Zone zone}
-# Contains zones that do not use DNSSEC (PROVEN using NSEC/3)
-invalidated_zones = dict()  # {str zone_name : str way_of_proving}
+validated_zones = dict()  # {str zone_name: CachedZone zone}
+# Contains zones that do not use DNSSEC (PROVEN using NSEC/3), until the
+# records of the proof expire. NSEC3 proofs also keep the cost of hashing.
+# {str zone_name: (str way_of_proving, int expiration, int iterations, float hash_time)}
+invalidated_zones = dict()
+# The caches above are checked for expired entries every prune_interval
+# seconds by long running processes.
+prune_interval = 60
+last_prune = 0
 
 # Contains the root zone. Caching mitigates the querying overhead.
 root_zone = None
+# Contains the local copy of the root zone, if one is used (RFC 8806).
+local_root_zone = None  # local_root.LocalRoot
+# Contains the DS digests of the root trust anchor.
+root_anchors = trust_anchor.load_anchors()
+
+# Serializes the revalidation of the root zone by concurrent requests.
+root_lock = threading.Lock()
+# Contains the zones that are being validated. Concurrent requests wait for
+# the same validation instead of starting their own.
+validating = dict()  # {str zone_name: Future}
+validating_lock = threading.Lock()
+
+# Runs the signature verifications and NSEC3 hashing. Inline by default.
+verifier = executor.VerificationExecutor()
+
+
+def negative_expiration(soa, now):
+  # Answers that a name does not exist are cached for the TTL of the SOA,
+  # but at most for its minimum field (RFC 2308, Section 5).
+  return int(now) + min(soa.ttl, soa[0].minimum)
 
 
 def is_valid_zone(zone):
   # Has this zone been checked before?
-  if zone in nonexisting_zones:
+  now = time.time()
+  expiration = nonexisting_zones.get(zone)
+  if expiration is not None:
+    if expiration >= now:
+      return False, None
+    nonexisting_zones.pop(zone, None)
+  cached = existing_zones.get(zone)
+  if cached is not None:
+    if cached[1] >= now:
+      return True, cached[0]
+    existing_zones.pop(zone, None)
+  # TLDs that are not delegated by the local root zone do not exist.
+  if local_root_zone is not None and is_tld(zone) and not local_root_zone.delegation(zone):
+    nonexisting_zones[zone] = negative_expiration(
+        local_root_zone.get('.', dns.rdatatype.SOA).rrset, now)
     return False, None
-  if zone in existing_zones:
-    return True, existing_zones.get(zone)
 
   # Has not been checked before. Check it!
   soa = query(zone, dns.rdatatype.SOA)
@@ -43,9 +104,9 @@ def is_valid_zone(zone):
     raise RessourceMissingError(f'SOA')
   exists = soa.rrset.name.to_text() == zone
   if exists:
-    existing_zones[zone] = soa
+    existing_zones[zone] = (soa, int(now) + soa.rrset.ttl)
     return exists, soa
-  nonexisting_zones.add(zone)
+  nonexisting_zones[zone] = negative_expiration(soa.rrset, now)
   return False, None
 
 
@@ -102,116 +163,201 @@ def query(zone, record_type, ns_addr='8.8.8.8'):
                   get_from(response, dns.rdatatype.RRSIG, record_type))
 
 
-def validate_NSEC3(zone_name, parent_zone, rrset, rrsig):
-  validate_rrsigset(rrset, rrsig, parent_zone.name,
-                    parent_zone.dnskey.rrset)
-  nsec3 = rrset[0]
-  hashed_name = dns.dnssec.nsec3_hash(
-      zone_name, nsec3.salt, nsec3.iterations, nsec3.algorithm)
-  parts = rrset.name.to_text().split('.')
-  if parts[0].upper() != hashed_name:
-    return False
-  else:
-    nsec3_str = nsec3.to_text()
-    if 'DS' in nsec3_str:
+def nsec3_hash(zone_name, params):
+  # Returns the hash and the seconds it took, also when it is remembered.
+  key = (zone_name,) + params
+  hashed = nsec.lookup_hash(key)
+  if hashed is None:
+    hashed = verifier.result(verifier.nsec3_hash(*key, inline=True))
+    nsec.store_hash(key, hashed)
+  return hashed
+
+
+def validate_NSEC3(zone_name, parent_zone, rrsets, rrsigs):
+  # Salt and iterations are the same for the whole chain. Hence the name is
+  # hashed once and only the record matching or covering it is verified.
+  # Returns the verdict, its expiration is None if nothing was proven.
+  params = nsec.nsec3_params(rrsets[0][0])
+  if params[1] > nsec.max_nsec3_iterations:
+    # Insecure without a proof (RFC 9276, Section 3.2).
+    return 'NSEC3_ITERATIONS', None, params[1], 0.0
+  hashed_name, seconds = nsec3_hash(zone_name, params)
+  unproven = ('NSEC3', None, params[1], seconds)
+  matching, covering = nsec.find_nsec3(hashed_name, params, rrsets)
+  if matching:
+    if nsec.has_type(matching[0], dns.rdatatype.DS):
       # In this case, something is VERY wrong.
       # The record should have been contained in the response.
       raise ShouldNotHappenError('NSEC3 proved existence of DS record')
-    return True
+    proof = matching
+  elif covering:
+    proof = covering
+  else:
+    return unproven
+  rrsig = nsec.find_rrsig(proof, rrsigs)
+  if not validate_rrsigset(proof, rrsig, parent_zone.name, parent_zone.keys):
+    return unproven
+  expiration = nsec.expiration(proof, rrsig, time.time())
+  nsec.add_denial(parent_zone.name, 'NSEC3', params, nsec.owner_hash(proof),
+                  nsec.next_hash(proof[0]), nsec.has_type(proof[0], dns.rdatatype.DS),
+                  expiration)
+  return 'NSEC3', expiration, params[1], seconds
 
 
-def validate_NSEC(zone_name, parent_zone, rrset, rrsig):
-  validate_rrsigset(rrset, rrsig, parent_zone.name,
-                    parent_zone.dnskey.rrset)
-  if rrset.name.to_text() != zone_name:
-    return False
-  else:
-    nsec_str = rrset[0].to_text()
-    if 'DS' in nsec_str:
+def validate_NSEC(zone_name, parent_zone, rrsets, rrsigs):
+  matching, covering = nsec.find_nsec(dns.name.from_text(zone_name), rrsets)
+  if matching:
+    if nsec.has_type(matching[0], dns.rdatatype.DS):
       # In this case, something is VERY wrong.
       # The record should have been contained in the response.
       raise ShouldNotHappenError('NSEC proved existence of DS record')
-    return True
+    proof = matching
+  elif covering:
+    proof = covering
+  else:
+    return 'NSEC', None, None, None
+  rrsig = nsec.find_rrsig(proof, rrsigs)
+  if not validate_rrsigset(proof, rrsig, parent_zone.name, parent_zone.keys):
+    return 'NSEC', None, None, None
+  expiration = nsec.expiration(proof, rrsig, time.time())
+  nsec.add_denial(parent_zone.name, 'NSEC', None, proof.name, proof[0].next,
+                  nsec.has_type(proof[0], dns.rdatatype.DS), expiration)
+  return 'NSEC', expiration, None, None
+
+
+def lookup_denial(zone, parent_zone):
+  # Checks whether previously validated NSEC/NSEC3 records of the parent
+  # already prove that the zone has no DS record. Returns the verdict.
+  ranges = nsec.denial_ranges.get(parent_zone.name)
+  if ranges is None:
+    return None
+  iterations = seconds = None
+  if ranges.nsec_type == 'NSEC3':
+    value, seconds = nsec3_hash(zone.name, ranges.params)
+    iterations = ranges.params[1]
+  else:
+    value = dns.name.from_text(zone.name)
+  expiration = ranges.proves_absence(value, time.time())
+  if expiration is not None:
+    return ranges.nsec_type, expiration, iterations, seconds
+  return None
+
+
+def response_expiration(response, now):
+  # Verdicts without a valid proof last as long as the records they are
+  # based on.
+  return int(now) + min((rrset.ttl for rrset in response.answer + response.authority),
+                        default=0)
 
 
 def query_DS(zone, parent_zone):
-  if zone.name in invalidated_zones:
-    return None, invalidated_zones.get(zone.name)
-  response = raw_query(zone.name, dns.rdatatype.DS, parent_zone.ns)
+  # Returns the DS records, or the verdict proving that there are none.
+  cached = invalidated_zones.get(zone.name)
+  if cached is not None:
+    if cached[1] >= time.time():
+      return None, cached
+    invalidated_zones.pop(zone.name, None)
+  denial = lookup_denial(zone, parent_zone)
+  if denial:
+    invalidated_zones[zone.name] = denial
+    return None, denial
+  if local_root_zone is not None and parent_zone.name == '.':
+    response = local_root_zone.query(zone.name, dns.rdatatype.DS)
+  else:
+    response = raw_query(zone.name, dns.rdatatype.DS, parent_zone.ns)
   ds = Response(get_from(response, dns.rdatatype.DS),
                 get_from(response, dns.rdatatype.RRSIG, dns.rdatatype.DS))
   if ds.rrset:
     return ds, None
   # DS record seems to be nonexistent.. Prove that using NSEC3!
-  nsec = Response(get_all_from(response, dns.rdatatype.NSEC3),
-                  get_all_from(response, dns.rdatatype.RRSIG, dns.rdatatype.NSEC3))
-  if nsec.rrsig:
-    nsec_type = 'NSEC3'
-    for i in range(len(nsec.rrsig)):
-      if validate_NSEC3(zone.name, parent_zone, nsec.rrset[i], nsec.rrsig[i]):
-        break
+  nsec3 = Response(get_all_from(response, dns.rdatatype.NSEC3),
+                   get_all_from(response, dns.rdatatype.RRSIG, dns.rdatatype.NSEC3))
+  if nsec3.rrsig:
+    verdict = validate_NSEC3(zone.name, parent_zone, nsec3.rrset, nsec3.rrsig)
   else:
     # NSEC used.. This is definitely NOT Standard conforming..
-    nsec_type = 'NSEC'
-    nsec = Response(get_all_from(response, dns.rdatatype.NSEC),
-                    get_all_from(response, dns.rdatatype.RRSIG, dns.rdatatype.NSEC))
-    for i in range(len(nsec.rrset)):
-      if validate_NSEC(zone.name, parent_zone, nsec.rrset[i], nsec.rrsig[i]):
-        break
-  invalidated_zones[zone.name] = nsec_type
-  return None, nsec_type
+    nsec_records = Response(get_all_from(response, dns.rdatatype.NSEC),
+                            get_all_from(response, dns.rdatatype.RRSIG, dns.rdatatype.NSEC))
+    verdict = validate_NSEC(zone.name, parent_zone, nsec_records.rrset, nsec_records.rrsig)
+  if verdict[1] is None:
+    verdict = (verdict[0], response_expiration(response, time.time())) + verdict[2:]
+  invalidated_zones[zone.name] = verdict
+  return None, verdict
 
 
-def validate_zsk(domain, zsk_set, ds_set):
-  if not zsk_set:
+def validate_zsk(domain, keys, ds_set):
+  if not keys or not keys.keys:
     raise EmptyError('empty ZSK set')
   if not ds_set:
     raise EmptyError('empty DS set')
   for ds in ds_set:
-    # Iterating over the whole ZSK set is necessary since some zones are
+    # Checking all keys with a matching tag is necessary since some zones are
     # signed using the KSK (256).. Hence getting the ZSK (257) for
     # validation will fail in some edge cases.
-    for zsk in zsk_set:
+    for zsk in keys.keys.get((ds.key_tag, ds.algorithm), []):
       zsk_ds = dns.dnssec.make_ds(domain, zsk, ds.digest_type)
       if ds == zsk_ds:
         return True
   return False
 
 
-def validate_root_zsk(dnskey_set):
-  # https://data.iana.org/root-anchors/root-anchors.xml
-  root_ds_list = ['19036 8 2 49aac11d7b6f6446702e54a1607371607a1a41855200fd2ce1cdde32f24e8fb5',
-                  '20326 8 2 e06d44b80b8f1d39a95c0b0d7c65d08458e880409bbc683457104237c7f8ec8d']
-  for zsk in dnskey_set:
-    ds = dns.dnssec.make_ds('.', zsk, dns.dnssec.DSDigest.SHA256)
-    for root_ds in root_ds_list:
-      if root_ds == ds.to_text():
-        return
-  raise ShouldNotHappenError('could not validate root ZSK')
+def validate_root_zsk(keys):
+  if not trust_anchor.matches(root_anchors, '.', keys):
+    raise ShouldNotHappenError('could not validate root ZSK')
 
 
-def validate_rrsigset(rrset, rrsig, zone, key):
-  try:
-    dns.dnssec.validate(rrset, rrsig, {dns.name.from_text(zone): key})
-  except Exception:
-    return False
-  return True
+def validate_rrsigset_async(rrset, rrsig, zone, keys, inline=False):
+  future = Future()
+  if rrset is None or rrsig is None or keys is None:
+    future.set_result(False)
+    return future
+  now = time.time()
+  cache_key = verification.cache_key(rrset, rrsig, zone, keys)
+  valid = verification.lookup(cache_key, now)
+  if valid is not None:
+    future.set_result(valid)
+    return future
+  future = verifier.verify(rrset, rrsig, zone, keys, inline)
+  future.add_done_callback(lambda done: verification.store(
+      cache_key, rrsig, done.result(), now))
+  return future
+
 
+def validate_rrsigset(rrset, rrsig, zone, keys):
+  # A single check is done inline, handing it to a worker costs more.
+  return verifier.result(validate_rrsigset_async(rrset, rrsig, zone, keys, inline=True))
 
-def validate_root_zone():
+
+def validate_root_zone(ns='198.41.0.4', snapshot_path=None):
+  # The default ns is a.root-servers.net. This doesn't have to be validated!
   global root_zone
-  ns = '198.41.0.4'  # IP of a.root-servers.net. This doesn't have to be validated!
-  dnskey = query('.', dns.rdatatype.DNSKEY, ns)
+  if snapshot_path and local_root_zone is None:
+    root_zone = trust_anchor.load_snapshot(snapshot_path, root_anchors)
+    if root_zone:
+      return
+  if local_root_zone is not None:
+    dnskey = local_root_zone.get('.', dns.rdatatype.DNSKEY)
+  else:
+    dnskey = query('.', dns.rdatatype.DNSKEY, ns)
   if dnskey.rrset is None:
     raise RessourceMissingError('DNSKEY')
-  zone = Zone('.', dnskey, ns, None, None)
+  zone = Zone('.', dnskey, ns, None, None,
+              verification.index_keys(dnskey.rrset))
 
   # Validate
   if not validate_rrsigset(
-          dnskey.rrset, dnskey.rrsig, '.', dnskey.rrset):
+          dnskey.rrset, dnskey.rrsig, '.', zone.keys):
     raise ShouldNotHappenError('could not validate root DNSKEY RRSIG')
-  validate_root_zsk(dnskey.rrset)
+  validate_root_zsk(zone.keys)
+  if local_root_zone is not None:
+    # The DNSKEY is trusted now, the ZONEMD covers all other records.
+    zonemd = local_root_zone.get('.', dns.rdatatype.ZONEMD)
+    if not validate_rrsigset(zonemd.rrset, zonemd.rrsig, '.', zone.keys):
+      raise ShouldNotHappenError('could not validate root ZONEMD RRSIG')
+    local_root_zone.verify_digest()
   root_zone = zone
+  if snapshot_path:
+    trust_anchor.save_snapshot(snapshot_path, zone, root_anchors)
 
 
 def parse_deployed_keys(dnskey_rrset):
@@ -220,7 +366,7 @@ def parse_deployed_keys(dnskey_rrset):
   for key in dnskey_rrset:
     counts[key.flags] += 1
     algorithms.add(dns.dnssec.algorithm_to_text(key.algorithm))
-  return counts[257], counts[256], list(algorithms)
+  return counts[257], counts[256], intern_tuple(sorted(algorithms))
 
 
 def parse_ds_digests(ds_rrset):
@@ -228,36 +374,71 @@ def parse_ds_digests(ds_rrset):
   digests = set()
   for ds in ds_rrset:
     digests.add(strings[ds.digest_type])
-  return list(digests)
+  return intern_tuple(sorted(digests))
 
 
-def validate_zone(zone, parent_zone):
+def start_zone(zone, parent_zone):
+  # Queries the records of a zone and submits its signatures for
+  # verification. Returns the ZoneInfo and the pending checks, which are
+  # None if the zone already failed.
   zone_info = ZoneInfo(zone.name)
   try:
-    ns_addr = query(zone.soa.rrset[0].mname.to_text(), dns.rdatatype.A)
-    if ns_addr.rrset is None:
-      raise RessourceMissingError(f'NS A')
-    zone.ns = ns_addr.rrset[0].to_text()
-    ds, nsec_type = query_DS(zone, parent_zone)
+    if zone.soa is None:
+      # Zones that were cached when the domain was split have no SOA.
+      zone.soa = query(zone.name, dns.rdatatype.SOA)
+      if zone.soa.rrset is None:
+        raise RessourceMissingError(f'SOA')
+    if local_root_zone is not None and parent_zone.name == '.':
+      zone.ns = local_root_zone.glue(zone.name)
+    if zone.ns is None:
+      ns_addr = query(zone.soa.rrset[0].mname.to_text(), dns.rdatatype.A)
+      if ns_addr.rrset is None:
+        raise RessourceMissingError(f'NS A')
+      zone.ns = ns_addr.rrset[0].to_text()
+    ds, verdict = query_DS(zone, parent_zone)
+    nsec_type = None
     if ds:
       zone_info.ds_digests = parse_ds_digests(ds.rrset)
+    else:
+      nsec_type, _, zone_info.nsec3_iterations, zone_info.nsec3_hash_time = verdict
     zone.dnskey = query(zone.name, dns.rdatatype.DNSKEY, zone.ns)
+    for response in [zone.soa, zone.dnskey, ds]:
+      zone_info.add_signed(response)
     ## Checks ##
     zone_info.has_dnskey = zone.dnskey.rrset is not None
     zone_info.has_ds = ds is not None
+    # The signatures are independent of each other, verify them concurrently.
+    valid_dnskey = valid_ds = None
     if zone_info.has_dnskey:
-      zone_info.valid_dnskey = validate_rrsigset(
-          zone.dnskey.rrset, zone.dnskey.rrsig, zone.name, zone.dnskey.rrset)
+      zone.keys = verification.index_keys(zone.dnskey.rrset)
+      valid_dnskey = validate_rrsigset_async(
+          zone.dnskey.rrset, zone.dnskey.rrsig, zone.name, zone.keys)
       zone_info.num_ksk, zone_info.num_zsk, zone_info.key_algos = parse_deployed_keys(
           zone.dnskey.rrset)
-    if ds and parent_zone.dnskey.rrset:
-      zone_info.valid_ds = validate_rrsigset(ds.rrset, ds.rrsig, parent_zone.name,
-                                             parent_zone.dnskey.rrset)
-    zone_info.valid_soa = validate_rrsigset(zone.soa.rrset, zone.soa.rrsig,
-                                            zone.name, zone.dnskey.rrset)
+    if ds and parent_zone.keys:
+      valid_ds = validate_rrsigset_async(ds.rrset, ds.rrsig, parent_zone.name,
+                                         parent_zone.keys)
+    valid_soa = validate_rrsigset_async(zone.soa.rrset, zone.soa.rrsig,
+                                        zone.name, zone.keys)
+    return zone_info, (ds, nsec_type, valid_dnskey, valid_ds, valid_soa)
+  except Exception as e:
+    zone_info.from_error(e)
+  return zone_info, None
+
+
+def finish_zone(zone, zone_info, checks):
+  if checks is None:
+    return zone, zone_info
+  ds, nsec_type, valid_dnskey, valid_ds, valid_soa = checks
+  try:
+    if valid_dnskey:
+      zone_info.valid_dnskey = verifier.result(valid_dnskey)
+    if valid_ds:
+      zone_info.valid_ds = verifier.result(valid_ds)
+    zone_info.valid_soa = verifier.result(valid_soa)
     if zone_info.has_ds and zone_info.has_dnskey:
       zone_info.validated = validate_zsk(
-          zone.name, zone.dnskey.rrset, ds.rrset)
+          zone.name, zone.keys, ds.rrset)
 
     if not zone_info.has_ds:
       zone_info.validation_state = 'UNSECURED'
@@ -267,31 +448,473 @@ def validate_zone(zone, parent_zone):
   return zone, zone_info
 
 
+def validate_zone(zone, parent_zone):
+  zone_info, checks = start_zone(zone, parent_zone)
+  verifier.flush()
+  return finish_zone(zone, zone_info, checks)
+
+
+def get_validated_zone(zone):
+  validated_zone = validated_zones.get(zone.name)
+  if validated_zone is None or validated_zone.expiration >= time.time():
+    return validated_zone
+  # The signatures have expired, the zone has to be validated again.
+  validated_zones.pop(zone.name, None)
+  existing_zones.pop(zone.name, None)
+  return None
+
+
+def claim_zone(zone_name):
+  # Returns the Future of the validation and whether the caller owns it.
+  with validating_lock:
+    future = validating.get(zone_name)
+    if future is not None:
+      return future, False
+    future = validating[zone_name] = Future()
+    return future, True
+
+
+def release_zone(zone_name, future, result):
+  # The result is cached before, later requests find it there.
+  with validating_lock:
+    validating.pop(zone_name, None)
+  if isinstance(result, Exception):
+    future.set_exception(result)
+  else:
+    future.set_result(result)
+
+
+def validate_chain_zone(zone, parent_zone):
+  validated_zone = get_validated_zone(zone)
+  if validated_zone is not None:
+    return validated_zone, validated_zone.info
+  future, owned = claim_zone(zone.name)
+  if not owned:
+    return future.result()
+  try:
+    # Another request may have finished the zone in the meantime.
+    validated_zone = get_validated_zone(zone)
+    if validated_zone is not None:
+      result = validated_zone, validated_zone.info
+    else:
+      result = cache_zone(*validate_zone(zone, parent_zone))
+  except Exception as e:
+    release_zone(zone.name, future, e)
+    raise
+  release_zone(zone.name, future, result)
+  return result
+
+
+def cache_zone(zone, zone_info):
+  if not zone_info:
+    return zone, zone_info
+  validated_zone = CachedZone.from_zone(zone, zone_info)
+  validated_zones[zone.name] = validated_zone
+  existing_zones[zone.name] = (None, validated_zone.expiration)
+  return validated_zone, zone_info
+
+
 def validate_chain(domain):
   current_validation = ValidationResult(domain)
   try:
     parent_zone = root_zone
     for zone in split(domain):
-      validated_zone = validated_zones.get(zone.name)
-      if validated_zone is None:
-        validated_zone, zone_info = validate_zone(
-            zone, parent_zone)
-        if zone_info:
-          validated_zone.info = zone_info
-          validated_zones[zone.name] = validated_zone
-        else:
-          current_validation.from_zone_info(zone_info)
-        current_validation.zones.append(zone_info)
-      else:
-        current_validation.zones.append(validated_zone.info)
+      validated_zone, zone_info = validate_chain_zone(zone, parent_zone)
+      if not zone_info:
+        current_validation.from_zone_info(zone_info)
+      current_validation.zones.append(zone_info)
       parent_zone = validated_zone
   except Exception as e:
     current_validation.from_error(e)
   return current_validation
 
 
-def test(domains):
-  validate_root_zone()
+def try_split(domain):
+  try:
+    return split(domain)
+  except Exception as e:
+    return e
+
+
+def assemble_chain(domain, chain, validated):
+  current_validation = ValidationResult(domain)
+  try:
+    if isinstance(chain, Exception):
+      raise chain
+    for zone in chain:
+      result = validated[zone.name]
+      if isinstance(result, Exception):
+        raise result
+      zone_info = result[1]
+      if not zone_info:
+        current_validation.from_zone_info(zone_info)
+      current_validation.zones.append(zone_info)
+  except Exception as e:
+    current_validation.from_error(e)
+  return current_validation
+
+
+def validate_planned(domains, pool):
+  # Validates a batch of domains zone by zone instead of domain by domain.
+  # The zone cuts of all domains are looked up first, then every distinct
+  # zone is validated once. Zones are validated level by level, so that the
+  # parent of a zone is always done before it, and the zones of one level
+  # are validated in parallel.
+  chains = list(pool.map(try_split, domains))
+  parents = dict()  # {str zone_name: (Zone zone, str parent_name)}
+  for chain in chains:
+    if isinstance(chain, Exception):
+      continue
+    parent_name = root_zone.name
+    for zone in chain:
+      parents.setdefault(zone.name, (zone, parent_name))
+      parent_name = zone.name
+  levels = defaultdict(list)  # {int labels: [str zone_name]}
+  for zone_name in parents:
+    levels[zone_name.count('.')].append(zone_name)
+
+  # {str zone_name: (validated zone, ZoneInfo) or Exception}
+  validated = {root_zone.name: (root_zone, None)}
+
+  def start_level_zone(zone_name):
+    # Returns the cached zone, the started validation, the Future of a
+    # validation by another request or an Exception.
+    zone, parent_name = parents[zone_name]
+    parent = validated[parent_name]
+    if isinstance(parent, Exception):
+      return parent
+    validated_zone = get_validated_zone(zone)
+    if validated_zone is not None:
+      return validated_zone, validated_zone.info
+    future, owned = claim_zone(zone_name)
+    if not owned:
+      return future
+    validated_zone = get_validated_zone(zone)
+    if validated_zone is not None:
+      release_zone(zone_name, future, (validated_zone, validated_zone.info))
+      return validated_zone, validated_zone.info
+    return zone, future, start_zone(zone, parent[0])
+
+  def finish_level_zone(zone_name, started):
+    if isinstance(started, Exception) or len(started) == 2:
+      return started
+    zone, future, (zone_info, checks) = started
+    try:
+      result = cache_zone(*finish_zone(zone, zone_info, checks))
+    except Exception as e:
+      result = e
+    release_zone(zone_name, future, result)
+    return result
+
+  def wait_level_zone(future):
+    try:
+      return future.result()
+    except Exception as e:
+      return e
+
+  # The signatures of a whole level are verified as one batch. The own
+  # validations are finished before waiting for other requests, so two
+  # requests never wait for each other.
+  for labels in sorted(levels):
+    zone_names = levels[labels]
+    started = dict(zip(zone_names, pool.map(start_level_zone, zone_names)))
+    verifier.flush()
+    for zone_name, result in started.items():
+      if not isinstance(result, Future):
+        validated[zone_name] = finish_level_zone(zone_name, result)
+    for zone_name, result in started.items():
+      if isinstance(result, Future):
+        validated[zone_name] = wait_level_zone(result)
+  return [assemble_chain(domain, chain, validated)
+          for domain, chain in zip(domains, chains)]
+
+
+def probe(domains, plan_batch=None, plan_workers=32):
+  # Yields (input index, ValidationResult) for (input index, domain) tuples.
+  if not plan_batch:
+    for index, domain in domains:
+      yield index, validate_chain(domain)
+    return
+  with ThreadPoolExecutor(plan_workers) as pool:
+    while True:
+      batch = list(itertools.islice(domains, plan_batch))
+      if not batch:
+        break
+      results = validate_planned([domain for _, domain in batch], pool)
+      for (index, _), result in zip(batch, results):
+        yield index, result
+
+
+def cache_state():
+  now = time.time()
+  return {'validated_zones': [checkpoint.cached_zone_as_dict(zone)
+                              for zone in validated_zones.values() if zone.expiration >= now],
+          'invalidated_zones': {zone: verdict for zone, verdict in invalidated_zones.items()
+                                if verdict[1] >= now},
+          'nonexisting_zones': {zone: expiration for zone, expiration in nonexisting_zones.items()
+                                if expiration >= now},
+          'denial_ranges': {zone: checkpoint.denial_as_dict(ranges, now)
+                            for zone, ranges in nsec.denial_ranges.items()}}
+
+
+def restore_cache(state):
+  for dct in state['validated_zones']:
+    validated_zone = checkpoint.cached_zone_from_dict(dct)
+    validated_zones[validated_zone.name] = validated_zone
+    existing_zones[validated_zone.name] = (None, validated_zone.expiration)
+  invalidated_zones.update((zone, tuple(verdict))
+                           for zone, verdict in state['invalidated_zones'].items())
+  nonexisting_zones.update(state['nonexisting_zones'])
+  for zone, dct in state['denial_ranges'].items():
+    nsec.denial_ranges[zone] = checkpoint.denial_from_dict(dct)
+
+
+def prewarm(zone_names, workers=32):
+  # Validates the given zones below the root, e.g. all TLDs, concurrently
+  # before probing starts. Returns the number of validated zones.
+  with ThreadPoolExecutor(workers) as pool:
+    results = validate_planned(zone_names, pool)
+  # Names that are no zone have an empty chain.
+  return sum(bool(result.zones) and result.validation_state == 'VALIDATED'
+             for result in results)
+
+
+def input_tlds(domains):
+  return sorted({domain.rstrip('.').rsplit('.', 1)[-1].lower() + '.' for domain in domains})
+
+
+def is_tld(zone_name):
+  return zone_name.count('.') == 1
+
+
+def save_tld_cache(path):
+  state = cache_state()
+  checkpoint.save(path, {
+      'anchors': trust_anchor.anchors_fingerprint(root_anchors),
+      'cache': {'validated_zones': [zone for zone in state['validated_zones'] if is_tld(zone['name'])],
+                'invalidated_zones': {zone_name: verdict for zone_name, verdict
+                                      in state['invalidated_zones'].items() if is_tld(zone_name)},
+                'nonexisting_zones': {zone_name: expiration for zone_name, expiration
+                                      in state['nonexisting_zones'].items() if is_tld(zone_name)},
+                'denial_ranges': {'.': state['denial_ranges']['.']} if '.' in state['denial_ranges'] else {}}})
+
+
+def load_tld_cache(path):
+  # The TLDs were validated against the root anchors, other anchors need
+  # another validation.
+  tld_cache = checkpoint.load(path)
+  if tld_cache is None or tld_cache['anchors'] != trust_anchor.anchors_fingerprint(root_anchors):
+    return False
+  restore_cache(tld_cache['cache'])
+  return True
+
+
+def write_checkpoint(path, input_path, writer, completed, expiry_index=None):
+  # Everything handed to the writer has to be on disk before the checkpoint
+  # claims it has been completed.
+  writer.sync()
+  checkpoint.save(path, {'input': input_path,
+                         'completed': completed,
+                         'output': writer.writer.state(),
+                         'cache': cache_state(),
+                         'expiry': expiry_index and expiry_index.expirations})
+
+
+def validate_zonefiles(paths, output_path, workers=0):
+  # The signatures are verified by a process pool of its own, the executor
+  # is not used.
+  output_file = open(output_path, 'wb') if output_path else sys.stdout.buffer
+  for path in paths:
+    zone_info, stats = zonefile.validate_zonefile(path, workers)
+    dct = codec.zone_as_dict(zone_info)
+    dct['path'] = path
+    dct['stats'] = stats
+    output_file.write(codec.dumps(dct) + b'\n')
+    output_file.flush()
+  if output_path:
+    output_file.close()
+
+
+def root_expiration():
+  return min(rrsig.expiration for rrsig in root_zone.dnskey.rrsig)
+
+
+def refresh_root_zone(ns, snapshot_path):
+  # A long running process outlives the signatures of the root DNSKEY.
+  with root_lock:
+    if root_expiration() < time.time():
+      validate_root_zone(ns, snapshot_path)
+
+
+def prune_caches(now):
+  # Entries are dropped when they are looked up after they expired. Long
+  # running processes also drop those that are never looked up again.
+  global last_prune
+  last_prune = now
+  for zone_name, zone in list(validated_zones.items()):
+    if zone.expiration < now:
+      validated_zones.pop(zone_name, None)
+  for cache in [existing_zones, invalidated_zones]:
+    for zone_name, entry in list(cache.items()):
+      if entry[1] < now:
+        cache.pop(zone_name, None)
+  for zone_name, expiration in list(nonexisting_zones.items()):
+    if expiration < now:
+      nonexisting_zones.pop(zone_name, None)
+  for zone_name, ranges in list(nsec.denial_ranges.items()):
+    if not ranges.prune(now):
+      nsec.denial_ranges.pop(zone_name, None)
+
+
+def validate_batch(domains, pool, root_ns, root_snapshot):
+  refresh_root_zone(root_ns, root_snapshot)
+  now = time.time()
+  if now - last_prune >= prune_interval:
+    prune_caches(now)
+  if len(domains) == 1:
+    return [validate_chain(domains[0])]
+  return validate_planned(domains, pool)
+
+
+def cache_stats():
+  return {'validated_zones': len(validated_zones),
+          'existing_zones': len(existing_zones),
+          'invalidated_zones': len(invalidated_zones),
+          'nonexisting_zones': len(nonexisting_zones),
+          'denial_ranges': len(nsec.denial_ranges),
+          'root_expiration': root_expiration()}
+
+
+def forget_zone(zone_name):
+  # Drops everything cached about a zone, so it is looked up again.
+  validated_zones.pop(zone_name, None)
+  existing_zones.pop(zone_name, None)
+  invalidated_zones.pop(zone_name, None)
+  nonexisting_zones.pop(zone_name, None)
+  nsec.denial_ranges.pop(zone_name, None)
+
+
+def zone_due(zone_name, now, min_interval, max_interval):
+  # The earliest RRSIG expiration or TTL of a validated zone. Unsigned zones
+  # are checked again after max_interval.
+  due = now + max_interval
+  zone = validated_zones.get(zone_name)
+  if zone is not None:
+    due = min(due, zone.expiration, zone.refresh)
+  return max(due, now + min_interval)
+
+
+def revalidate_zones(zone_schedule, zone_names, min_interval, max_interval):
+  # Validates each due zone once, parents before their children. Returns
+  # the zones whose result changed.
+  changed = []
+  for zone_name in sorted(zone_names, key=lambda name: name.count('.')):
+    forget_zone(zone_name)
+    result = validate_chain(zone_name)
+    zone_info = next((zone_info for zone_info in result.zones if zone_info.name == zone_name), None)
+    if zone_info is None:
+      # No zone anymore, its domains are probed again.
+      zone_schedule.remove(zone_name)
+      changed.append(zone_name)
+    elif zone_schedule.update(zone_name, scheduler.zone_key(zone_info),
+                              zone_due(zone_name, time.time(), min_interval, max_interval)):
+      changed.append(zone_name)
+  return changed
+
+
+def reprobe(zone_schedule, domain_schedule, writer, root_ns, root_snapshot, min_interval,
+            max_interval, plan_batch=None, plan_workers=32):
+  # Validates the zones that are due and probes the domains that are due or
+  # below a zone that changed. Only results that changed are written.
+  # Returns the number of validated zones, probed and changed domains.
+  now = time.time()
+  refresh_root_zone(root_ns, root_snapshot)
+  prune_caches(now)
+  zone_names = zone_schedule.pop_due(now)
+  changed_zones = revalidate_zones(zone_schedule, zone_names, min_interval, max_interval)
+  domains = domain_schedule.pop_due(now)
+  for domain in domains:
+    # New zone cuts are only noticed when the labels are looked up again.
+    labels = domain.lower().rstrip('.').split('.')
+    for i in range(len(labels)):
+      nonexisting_zones.pop('.'.join(labels[i:]) + '.', None)
+  # Everything below a zone that changed is validated and probed again.
+  stale = set()
+  if changed_zones:
+    stale = {zone_name for zone_name in zone_schedule.entries if zone_name not in changed_zones
+             and any(scheduler.is_below(zone_name, changed) for changed in changed_zones)}
+    for zone_name in stale:
+      forget_zone(zone_name)
+    due = set(domains)
+    domains += [domain for domain in domain_schedule.entries if domain not in due and any(
+        scheduler.is_below(domain, zone_name) for zone_name in changed_zones)]
+  changed = 0
+  for _, result in tqdm(probe(enumerate(domains), plan_batch, plan_workers), total=len(domains)):
+    now = time.time()
+    for zone_info in result.zones:
+      if zone_info.name not in zone_schedule or zone_info.name in stale:
+        stale.discard(zone_info.name)
+        zone_schedule.update(zone_info.name, scheduler.zone_key(zone_info),
+                             zone_due(zone_info.name, now, min_interval, max_interval))
+    if domain_schedule.update(result.name, scheduler.result_key(result), now + max_interval):
+      writer.write(result)
+      changed += 1
+  return len(zone_names), len(domains), changed
+
+
+def save_schedule(path, input_path, zone_schedule, domain_schedule, writer):
+  writer.sync()
+  checkpoint.save(path, {'input': input_path,
+                         'output': writer.writer.state(),
+                         'zones': zone_schedule.state(),
+                         'domains': domain_schedule.state(),
+                         'cache': cache_state()})
+
+
+def run_schedule(args):
+  # Keeps probing the input. Zones are validated again once their signatures
+  # or TTLs run out, domains after max_interval or when a zone above them
+  # changed. Only results that changed are appended to the output.
+  state = checkpoint.load(args.schedule)
+  if state is not None and state['input'] != args.input:
+    print('The schedule belongs to', state['input'])
+    exit(-1)
+  table_writer = output.JSONLWriter(args.output, args.zones_output, args.compress,
+                                    args.rotate_size, args.rotate_records,
+                                    state and state['output'])
+  writer = output.BackgroundWriter(
+      table_writer, flush_interval=args.flush_interval, fsync_interval=args.fsync_interval)
+  zone_schedule = scheduler.Scheduler()
+  domain_schedule = scheduler.Scheduler()
+  if state is not None:
+    zone_schedule.restore(state['zones'])
+    domain_schedule.restore(state['domains'])
+    restore_cache(state['cache'])
+  added = sum(domain_schedule.add(domain) for domain in inputs.read_domains(
+      args.input, args.column, args.skip, args.limit, args.shard))
+  print('Scheduled', len(domain_schedule), 'domains,', added, 'new')
+  validate_root_zone(args.root_ns, args.root_cache)
+  try:
+    while True:
+      zones, probed, changed = reprobe(zone_schedule, domain_schedule, writer, args.root_ns,
+                                       args.root_cache, args.min_interval, args.max_interval,
+                                       args.plan_batch if args.plan else None, args.plan_workers)
+      save_schedule(args.schedule, args.input, zone_schedule, domain_schedule, writer)
+      print('Validated', zones, 'zones, probed', probed, 'domains,', changed, 'changed')
+      if args.once:
+        break
+      due = [due for due in [zone_schedule.next_due(), domain_schedule.next_due()]
+             if due is not None]
+      if not due:
+        break
+      time.sleep(max(0, min(due) - time.time()))
+  except KeyboardInterrupt:
+    pass
+  writer.close()
+
+
+def test(domains, root_ns, root_snapshot):
+  validate_root_zone(root_ns, root_snapshot)
   for domain in domains:
     print('Checking:', domain)
     print(validate_chain(domain))
@@ -302,29 +925,206 @@ def main():
   parser = argparse.ArgumentParser()
   parser.add_argument('--test', nargs='+',
                       help='One or more domains to validate')
-  parser.add_argument('--input', help='The csv containing domains')
+  parser.add_argument('--zonefile', nargs='+',
+                      help='Validate zone files (e.g. AXFR or CZDS dumps) instead of probing domains')
+  parser.add_argument('--serve',
+                      help='Keep running and answer validation requests on HOST:PORT')
+  parser.add_argument('--socket',
+                      help='Keep running and answer validation requests on this Unix socket')
+  parser.add_argument('--max-batch', type=int, default=10000,
+                      help='Number of domains accepted per request with --serve and --socket')
+  parser.add_argument('--schedule',
+                      help='Keep probing the input once signatures or TTLs run out, the schedule is kept in this file')
+  parser.add_argument('--once', action='store_true',
+                      help='With --schedule, probe the domains that are due once and exit')
+  parser.add_argument('--min-interval', type=float, default=300,
+                      help='Seconds after which a zone is validated again at the earliest with --schedule')
+  parser.add_argument('--max-interval', type=float, default=86400,
+                      help='Seconds after which a zone or domain is checked again at the latest with --schedule')
+  parser.add_argument('--input',
+                      help='A list or csv of domains, may be compressed, - reads from stdin')
+  parser.add_argument('--column', type=int, default=1,
+                      help='The csv column containing the domain, 1 for Alexa, Tranco and Umbrella lists')
+  parser.add_argument('--skip', type=int, default=0,
+                      help='Skip the first SKIP domains')
+  parser.add_argument('--limit', type=int,
+                      help='Probe at most LIMIT domains')
+  parser.add_argument('--shard', type=inputs.parse_shard,
+                      help='Only probe the i-th of N parts of the input, given as i/N')
+  parser.add_argument('--sort-by-suffix', action='store_true',
+                      help='Probe the domains ordered by their reversed labels, so zones are probed together')
+  parser.add_argument('--sort-chunk-size', type=int, default=1000000,
+                      help='Number of domains sorted in memory, larger inputs are sorted on disk')
+  parser.add_argument('--resequence', action='store_true',
+                      help='Write the output of --sort-by-suffix in input order')
+  parser.add_argument('--plan', action='store_true',
+                      help='Validate the distinct zones of a batch of domains once, level by level')
+  parser.add_argument('--plan-batch', type=int, default=100000,
+                      help='Number of domains planned together with --plan')
+  parser.add_argument('--plan-workers', type=int, default=32,
+                      help='Number of zones validated in parallel with --plan and --prewarm-tlds')
+  parser.add_argument('--prewarm-tlds', nargs='?', const='all', choices=['all', 'input'],
+                      help='Validate all TLDs (or the ones in the input) before probing')
+  parser.add_argument('--tld-cache',
+                      help='File that keeps the validated TLDs, shared by several probing runs')
+  parser.add_argument('--dedup', action='store_true',
+                      help='Skip domains that have been probed before, using a Bloom filter')
+  parser.add_argument('--dedup-capacity', type=int, default=10000000,
+                      help='Number of distinct domains the Bloom filter is sized for')
   parser.add_argument(
       '--output', help='The output path to write the csv to')
+  parser.add_argument('--zones-output',
+                      help='Write every zone once to this file and only reference it by ID in the output')
+  parser.add_argument('--format', choices=['jsonl', 'parquet', 'arrow'], default='jsonl',
+                      help='Write JSON lines or columnar domain and zone tables')
+  parser.add_argument('--expiry-index',
+                      help='Write the zones ordered by their earliest RRSIG expiration to this file')
+  parser.add_argument('--compress', choices=['gzip', 'zstd'],
+                      help='Compress the output files')
+  parser.add_argument('--rotate-size', type=int,
+                      help='Start a new output segment after this many (uncompressed) bytes')
+  parser.add_argument('--rotate-records', type=int,
+                      help='Start a new output segment after this many domains')
+  parser.add_argument('--flush-interval', type=float, default=1.0,
+                      help='Seconds after which the output is flushed')
+  parser.add_argument('--fsync-interval', type=float,
+                      help='Seconds after which the output is synced to disk')
+  parser.add_argument('--checkpoint-interval', type=float, default=300,
+                      help='Seconds after which the progress is saved to OUTPUT.checkpoint (0 = never)')
+  parser.add_argument('--resume', action='store_true',
+                      help='Continue an interrupted run from OUTPUT.checkpoint')
+  parser.add_argument('--trust-anchor',
+                      help='root-anchors.xml or a file with DS records of the root zone')
+  parser.add_argument('--root-ns', default='198.41.0.4',
+                      help='The nameserver to query the root DNSKEY from')
+  parser.add_argument('--root-zone',
+                      help='A copy of the root zone (RFC 8806), answers the root lookups offline')
+  parser.add_argument('--root-cache',
+                      help='File that caches the validated root DNSKEY until its RRSIG expires')
+  parser.add_argument('--max-nsec3-iterations', type=int, default=nsec.max_nsec3_iterations,
+                      help='Zones using more NSEC3 iterations are considered insecure (RFC 9276), '
+                           'with the reason NSEC3_ITERATIONS')
+  parser.add_argument('--verify-cache-size', type=int, default=verification.max_verified_rrsigsets,
+                      help='Number of verified RRSIG sets that are remembered')
+  parser.add_argument('--verify-workers', type=int, default=0,
+                      help='Number of workers verifying signatures (0 = inline)')
+  parser.add_argument('--verify-executor', choices=['process', 'thread'], default='process',
+                      help='Run the verification workers as processes or threads')
   args = parser.parse_args()
 
+  global verifier
+  verifier = executor.VerificationExecutor(
+      args.verify_workers, args.verify_executor)
+  nsec.max_nsec3_iterations = args.max_nsec3_iterations
+  verification.max_verified_rrsigsets = args.verify_cache_size
+
+  if args.trust_anchor:
+    global root_anchors
+    root_anchors = trust_anchor.load_anchors(args.trust_anchor)
+  if args.root_zone:
+    global local_root_zone
+    local_root_zone = local_root.load(args.root_zone)
   if args.test:
-    test(args.test)
+    test(args.test, args.root_ns, args.root_cache)
+  elif args.zonefile:
+    validate_zonefiles(args.zonefile, args.output, args.verify_workers)
+  elif args.serve or args.socket:
+    validate_root_zone(args.root_ns, args.root_cache)
+    if args.tld_cache:
+      load_tld_cache(args.tld_cache)
+    if args.prewarm_tlds:
+      tlds = [name.lower() + '.' for name in sorted(tld.tlds)]
+      print('Validated', prewarm(tlds, args.plan_workers), 'of', len(tlds), 'TLDs')
+    with ThreadPoolExecutor(args.plan_workers) as pool:
+      server.serve(lambda domains: validate_batch(domains, pool, args.root_ns, args.root_cache),
+                   cache_stats, args.serve, args.socket, args.max_batch)
+  elif not args.input:
+    print('An input HAS to be specified!')
+    exit(-1)
+  elif not args.output:
+    print('An output HAS to be specified!')
+    exit(-1)
+  elif args.schedule:
+    if args.format != 'jsonl' or args.resume or args.sort_by_suffix:
+      print('--schedule writes JSON lines and can not be combined with --resume or --sort-by-suffix!')
+      exit(-1)
+    run_schedule(args)
   else:
-    if not args.input:
-      print('An input HAS to be specified!')
+    if args.resequence and (args.resume or not args.sort_by_suffix):
+      print('--resequence requires --sort-by-suffix and can not be resumed!')
       exit(-1)
-    if not args.output:
-      print('An output HAS to be specified!')
+    checkpoint_path = args.output + '.checkpoint'
+    state = checkpoint.load(checkpoint_path) if args.resume else None
+    if state is not None and state['input'] != args.input:
+      print('The checkpoint belongs to', state['input'])
       exit(-1)
-    validate_root_zone()
-    with open(args.input, 'r') as csv_file:
-      reader = csv.reader(csv_file)
-      with open(args.output, 'w', encoding='utf-8') as json_file:
-        for domain in tqdm(reader):
-          result = validate_chain(domain[1])
-          json.dump(result.as_dict(), json_file, ensure_ascii=False)
-          json_file.write('\n')
-          json_file.flush()
+    if state is not None and args.expiry_index and state.get('expiry') is None:
+      # The zones of the completed domains would be missing from the index.
+      print('The checkpoint was written without --expiry-index')
+      exit(-1)
+    if args.format == 'jsonl':
+      table_writer = output.JSONLWriter(args.output, args.zones_output, args.compress,
+                                        args.rotate_size, args.rotate_records,
+                                        state and state['output'])
+    elif args.rotate_size or args.rotate_records or args.resume:
+      print('Columnar output can not be rotated or resumed!')
+      exit(-1)
+    else:
+      table_writer = columnar.ColumnarWriter(args.output, args.zones_output,
+                                             args.format, args.compress)
+    validate_root_zone(args.root_ns, args.root_cache)
+    completed = 0
+    if state is not None:
+      restore_cache(state['cache'])
+      completed = state['completed']
+    if args.tld_cache:
+      load_tld_cache(args.tld_cache)
+    if args.prewarm_tlds:
+      if args.prewarm_tlds == 'input':
+        if args.input == '-':
+          print('The TLDs of stdin can not be read ahead!')
+          exit(-1)
+        tlds = input_tlds(inputs.read_domains(args.input, args.column, args.skip,
+                                              args.limit, args.shard))
+      else:
+        tlds = [name.lower() + '.' for name in sorted(tld.tlds)]
+      print('Validated', prewarm(tlds, args.plan_workers), 'of', len(tlds), 'TLDs')
+      if args.tld_cache:
+        save_tld_cache(args.tld_cache)
+    # A resequenced output is only written at the end, there is nothing to save.
+    checkpointing = (args.format == 'jsonl' and args.checkpoint_interval > 0
+                     and not args.resequence)
+    dedup = inputs.BloomFilter(args.dedup_capacity) if args.dedup else None
+    domains = inputs.read_domains(args.input, args.column, args.skip, args.limit,
+                                  args.shard, dedup)
+    if args.sort_by_suffix:
+      domains = schedule.sort_by_suffix(domains, args.sort_chunk_size)
+    else:
+      domains = enumerate(domains)
+    if args.resequence:
+      table_writer = schedule.ResequencingWriter(table_writer)
+    writer = output.BackgroundWriter(
+        table_writer, flush_interval=args.flush_interval, fsync_interval=args.fsync_interval)
+    expiry_index = None
+    if args.expiry_index:
+      expiry_index = expiry.ExpiryIndex(state and state['expiry'])
+    last_checkpoint = time.monotonic()
+    results = probe(itertools.islice(domains, completed, None),
+                    args.plan_batch if args.plan else None, args.plan_workers)
+    for index, result in tqdm(results, initial=completed):
+      writer.write((index, result) if args.resequence else result)
+      if expiry_index is not None:
+        expiry_index.add(result)
+      completed += 1
+      if checkpointing and time.monotonic() - last_checkpoint >= args.checkpoint_interval:
+        write_checkpoint(checkpoint_path, args.input, writer, completed, expiry_index)
+        last_checkpoint = time.monotonic()
+    if checkpointing:
+      write_checkpoint(checkpoint_path, args.input, writer, completed, expiry_index)
+    writer.close()
+    if expiry_index is not None:
+      expiry_index.write(args.expiry_index)
+  verifier.shutdown()
 
 
 if __name__ == '__main__':
@@ -24,3 +24,7 @@ class RessourceMissingError(Exception):
 
 class ShouldNotHappenError(Exception):
   pass
+
+
+class ZoneFileError(Exception):
+  pass
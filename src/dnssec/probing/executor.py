@@ -0,0 +1,115 @@
+import dns.dnssec
+import threading
+import time
+
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from dnssec.probing import verification
+
+
+def run_job(job, now):
+  kind, args = job
+  if kind == 'rrsig':
+    try:
+      return verification.verify_rrsigset(*args, now)
+    except Exception:
+      return False
+  # The time is taken here, in a pool it would include the round trip.
+  start = time.perf_counter()
+  hashed_name = dns.dnssec.nsec3_hash(*args)
+  return hashed_name, time.perf_counter() - start
+
+
+def run_batch(jobs, now):
+  # Returns (exception, result) tuples, so a single failing job does not take
+  # down the rest of the batch.
+  results = []
+  for job in jobs:
+    try:
+      results.append((None, run_job(job, now)))
+    except Exception as e:
+      results.append((e, None))
+  return results
+
+
+class VerificationExecutor:
+  # Spreads the CPU-bound work (signature verification and NSEC3 hashing) over
+  # a pool of workers. Jobs are collected into batches, so that the overhead
+  # of handing work to another process is paid once per batch. Handing over
+  # costs more than a few verifications, hence batches smaller than min_batch
+  # and jobs submitted with inline=True are done in the calling thread. With
+  # zero workers, every job is done inline and an already finished future is
+  # returned.
+  def __init__(self, workers=0, kind='process', batch_size=32, min_batch=8):
+    self.batch_size = batch_size
+    self.min_batch = min_batch
+    self.pending = []  # [(job, Future)]
+    self.lock = threading.Lock()
+    if workers == 0:
+      self.pool = None
+    elif kind == 'process':
+      self.pool = ProcessPoolExecutor(workers)
+    elif kind == 'thread':
+      self.pool = ThreadPoolExecutor(workers)
+    else:
+      raise ValueError(f'unknown executor kind {kind}')
+
+  def verify(self, rrset, rrsig, zone, keys, inline=False):
+    return self.submit(('rrsig', (rrset, rrsig, zone, keys)), inline)
+
+  def nsec3_hash(self, name, salt, iterations, algorithm, inline=False):
+    return self.submit(('nsec3', (name, salt, iterations, algorithm)), inline)
+
+  def submit(self, job, inline=False):
+    future = Future()
+    if self.pool is None or inline:
+      try:
+        future.set_result(run_job(job, time.time()))
+      except Exception as e:
+        future.set_exception(e)
+      return future
+    with self.lock:
+      self.pending.append((job, future))
+      if len(self.pending) < self.batch_size:
+        return future
+    self.flush()
+    return future
+
+  def flush(self):
+    with self.lock:
+      batch, self.pending = self.pending, []
+    if not batch:
+      return
+    jobs = [job for job, _ in batch]
+    futures = [future for _, future in batch]
+
+    def done(batch_future):
+      try:
+        results = batch_future.result()
+      except Exception as e:
+        for future in futures:
+          future.set_exception(e)
+        return
+      for future, (exception, result) in zip(futures, results):
+        if exception is None:
+          future.set_result(result)
+        else:
+          future.set_exception(exception)
+    if len(batch) < self.min_batch:
+      done_future = Future()
+      done_future.set_result(run_batch(jobs, time.time()))
+      done(done_future)
+      return
+    self.pool.submit(run_batch, jobs, time.time()).add_done_callback(done)
+
+  def result(self, future):
+    # Waiting on a job that is still pending would block forever.
+    if not future.done():
+      self.flush()
+    return future.result()
+
+  def shutdown(self):
+    self.flush()
+    if self.pool is not None:
+      self.pool.shutdown()
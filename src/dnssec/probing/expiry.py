@@ -0,0 +1,65 @@
+import os
+
+
+# Index lines are '<expiration> <zone name>\n' with a zero padded expiration,
+# so that the text order of the lines is the order of the expirations.
+def format_line(expiration, zone_name):
+  return f'{expiration:010d} {zone_name}\n'.encode()
+
+
+def parse_line(line):
+  expiration, zone_name = line.decode().rstrip('\n').split(' ', 1)
+  return int(expiration), zone_name
+
+
+class ExpiryIndex:
+  # Collects the earliest RRSIG expiration of every zone of the results.
+  def __init__(self, expirations=None):
+    self.expirations = dict(expirations or {})  # {str zone_name: int expiration}
+
+  def add(self, result):
+    for zone_info in result.zones:
+      if zone_info.rrsig_expiration is None:
+        continue
+      expiration = self.expirations.get(zone_info.name)
+      if expiration is None or zone_info.rrsig_expiration < expiration:
+        self.expirations[zone_info.name] = zone_info.rrsig_expiration
+
+  def write(self, path):
+    tmp_path = f'{path}.{os.getpid()}'
+    with open(tmp_path, 'wb') as index_file:
+      for zone_name, expiration in sorted(self.expirations.items(),
+                                          key=lambda item: (item[1], item[0])):
+        index_file.write(format_line(expiration, zone_name))
+    os.replace(tmp_path, path)
+
+
+def seek_expiration(index_file, size, expiration):
+  # Returns the offset of the first line expiring at or after expiration.
+  # Bisects the byte offsets, a line belongs to the offset it starts after.
+  low, high = 0, size
+  while low < high:
+    middle = (low + high) // 2
+    index_file.seek(middle)
+    if middle > 0:
+      index_file.readline()
+    line = index_file.readline()
+    if not line or parse_line(line)[0] >= expiration:
+      high = middle
+    else:
+      low = middle + 1
+  index_file.seek(low)
+  if low > 0:
+    index_file.readline()
+  return index_file.tell()
+
+
+def read_range(path, start, end):
+  # Yields (int expiration, str zone_name) for start <= expiration < end.
+  with open(path, 'rb') as index_file:
+    index_file.seek(seek_expiration(index_file, os.path.getsize(path), start))
+    for line in index_file:
+      expiration, zone_name = parse_line(line)
+      if expiration >= end:
+        return
+      yield expiration, zone_name
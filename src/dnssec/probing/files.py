@@ -0,0 +1,214 @@
+import gzip
+import io
+import json
+import os
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+
+extensions = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def compression_of(path):
+  for compression, extension in extensions.items():
+    if path.endswith(extension):
+      return compression
+  return None
+
+
+def with_extension(path, compression):
+  extension = extensions.get(compression, '')
+  return path if path.endswith(extension) else path + extension
+
+
+def require_zstandard():
+  if zstandard is None:
+    raise ImportError('the zstandard package is required for zstd files')
+
+
+def open_read(path):
+  # Opens plain, gzip or zstd compressed files as binary stream.
+  compression = compression_of(path)
+  if compression == 'gzip':
+    return gzip.open(path, 'rb')
+  if compression == 'zstd':
+    require_zstandard()
+    return io.BufferedReader(zstandard.open(path, 'rb'))
+  return open(path, 'rb')
+
+
+class CompressedFile:
+  # A binary output file with optional streaming compression. The raw file is
+  # kept, so the data can be synced to disk after flushing.
+  def __init__(self, path, compression=None, mode='wb'):
+    self.raw = open(path, mode)
+    if compression == 'gzip':
+      self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb')
+    elif compression == 'zstd':
+      require_zstandard()
+      self.stream = zstandard.ZstdCompressor().stream_writer(self.raw)
+    else:
+      self.stream = self.raw
+
+  def write(self, data):
+    self.stream.write(data)
+
+  def flush(self, sync=False):
+    if self.stream is not self.raw:
+      if zstandard is not None and isinstance(self.stream, zstandard.ZstdCompressionWriter):
+        self.stream.flush(zstandard.FLUSH_BLOCK)
+      else:
+        self.stream.flush()
+    self.raw.flush()
+    if sync:
+      os.fsync(self.raw.fileno())
+
+  def close(self):
+    self.stream.close()
+    self.raw.close()
+
+
+def manifest_path(path):
+  return path + '.manifest'
+
+
+class SegmentedFile:
+  # Writes records to a sequence of (compressed) segment files. A new segment
+  # is started once max_bytes uncompressed bytes or max_records records have
+  # been written to the current one. Segments are listed in a manifest next
+  # to the output path, which is rewritten on every rotation. Every record
+  # is a single line, given segments of an earlier run, writing is resumed
+  # after their last record.
+  def __init__(self, path, compression=None, max_bytes=None, max_records=None,
+               segments=None):
+    self.path = path
+    self.compression = compression
+    self.max_bytes = max_bytes
+    self.max_records = max_records
+    self.rotating = bool(max_bytes or max_records)
+    self.segments = []  # [{'path': str, 'records': int, 'bytes': int}]
+    self.file = None
+    if segments:
+      self.resume(segments)
+    else:
+      self.open_segment()
+    self.write_manifest()
+
+  def segment_path(self, index):
+    if not self.rotating:
+      return with_extension(self.path, self.compression)
+    base, extension = os.path.splitext(self.path)
+    return with_extension(f'{base}.{index:04d}{extension}', self.compression)
+
+  def open_segment(self):
+    path = self.segment_path(len(self.segments))
+    self.file = CompressedFile(path, self.compression)
+    self.segments.append({'path': os.path.basename(path), 'records': 0, 'bytes': 0})
+
+  def resume(self, segments):
+    # Segments started after the checkpoint are removed and the last one is
+    # cut back to the records it contained back then.
+    index = len(segments)
+    while self.rotating and os.path.exists(self.segment_path(index)):
+      os.remove(self.segment_path(index))
+      index += 1
+    self.segments = [dict(segment) for segment in segments]
+    segment = self.segments[-1]
+    path = self.segment_path(len(self.segments) - 1)
+    if self.compression is None:
+      os.truncate(path, segment['bytes'])
+      self.file = CompressedFile(path, None, 'ab')
+      return
+    # A compressed stream can not be cut, the records are copied instead.
+    tmp_path = f'{path}.{os.getpid()}'
+    self.file = CompressedFile(tmp_path, self.compression)
+    with open_read(path) as segment_file:
+      for _, line in zip(range(segment['records']), segment_file):
+        self.file.write(line)
+    os.replace(tmp_path, path)
+
+  def exceeds(self, segment, size, records):
+    return bool((self.max_bytes and segment['bytes'] + size > self.max_bytes) or
+                (self.max_records and segment['records'] + records > self.max_records))
+
+  def rotate(self):
+    self.file.close()
+    self.open_segment()
+    self.write_manifest()
+
+  def write(self, data, records=1):
+    segment = self.segments[-1]
+    # A segment always gets at least one write, even if it is too big.
+    if self.rotating and segment['records'] and self.exceeds(segment, len(data), records):
+      self.rotate()
+    segment = self.segments[-1]
+    self.file.write(data)
+    segment['records'] += records
+    segment['bytes'] += len(data)
+
+  def write_records(self, records):
+    # Writes a batch of encoded records, split at the segment boundaries.
+    if not self.rotating:
+      self.write(b''.join(records), len(records))
+      return
+    start = 0
+    size = 0
+    segment = self.segments[-1]
+    for i, record in enumerate(records):
+      if (segment['records'] or i > start) and self.exceeds(segment, size + len(record), i - start + 1):
+        if i > start:
+          self.write(b''.join(records[start:i]), i - start)
+        self.rotate()
+        segment = self.segments[-1]
+        start = i
+        size = 0
+      size += len(record)
+    if start < len(records):
+      self.write(b''.join(records[start:]), len(records) - start)
+
+  def write_manifest(self):
+    if not self.rotating:
+      return
+    tmp_path = manifest_path(self.path) + '.tmp'
+    with open(tmp_path, 'w') as manifest_file:
+      json.dump({'compression': self.compression,
+                 'segments': self.segments}, manifest_file, indent=2)
+    os.replace(tmp_path, manifest_path(self.path))
+
+  def state(self):
+    return [dict(segment) for segment in self.segments]
+
+  def flush(self, sync=False):
+    self.file.flush(sync)
+
+  def close(self):
+    self.file.close()
+    self.write_manifest()
+
+
+def segment_paths(path):
+  # Returns the files written for an output path: the segments listed in its
+  # manifest, or the (compressed) file itself.
+  if path.endswith('.manifest'):
+    directory = os.path.dirname(path)
+    with open(path, 'r') as manifest_file:
+      manifest = json.load(manifest_file)
+    return [os.path.join(directory, segment['path']) for segment in manifest['segments']]
+  if os.path.exists(manifest_path(path)):
+    return segment_paths(manifest_path(path))
+  if not os.path.exists(path):
+    # The extension is added to compressed outputs when they are written.
+    for extension in extensions.values():
+      if os.path.exists(path + extension):
+        return [path + extension]
+  return [path]
+
+
+def read_lines(path):
+  for segment_path in segment_paths(path):
+    with open_read(segment_path) as segment_file:
+      for line in segment_file:
+        yield line
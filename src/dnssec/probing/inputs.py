@@ -0,0 +1,102 @@
+import hashlib
+import itertools
+import math
+import os
+import sys
+
+from dnssec.probing import files
+
+
+def parse_shard(text):
+  # 'i/N' selects the i-th of N shards, counting from 0.
+  shard, shards = (int(number) for number in text.split('/'))
+  if not 0 <= shard < shards:
+    raise ValueError(f'shard {text}')
+  return shard, shards
+
+
+def parse_domain(line, column):
+  # Accepts plain lists with one name per line as well as CSVs like the
+  # Alexa, Tranco or Umbrella lists ('1,google.com').
+  line = line.strip()
+  if not line or line.startswith('#'):
+    return None
+  if ',' not in line:
+    return line
+  fields = line.split(',')
+  if column >= len(fields):
+    return None
+  return fields[column].strip() or None
+
+
+def read_lines(path):
+  if path == '-':
+    yield from sys.stdin.buffer
+    return
+  yield from files.read_lines(path)
+
+
+def read_byte_range(path, start, end):
+  # Reads the lines starting within [start, end). The line that is cut by
+  # start belongs to the previous range.
+  with open(path, 'rb') as input_file:
+    if start > 0:
+      input_file.seek(start - 1)
+      input_file.readline()
+    while input_file.tell() < end:
+      line = input_file.readline()
+      if not line:
+        break
+      yield line
+
+
+def read_shard(path, shard, shards):
+  if path != '-' and files.compression_of(path) is None and os.path.isfile(path):
+    # Plain files are split into byte ranges, every shard only reads its own.
+    size = os.path.getsize(path)
+    return read_byte_range(path, size * shard // shards, size * (shard + 1) // shards)
+  # Streams can not be seeked, every shard reads all and keeps each N-th line.
+  return itertools.islice(read_lines(path), shard, None, shards)
+
+
+class BloomFilter:
+  # Remembers names in a fixed bit array sized for capacity names and the
+  # error rate. A false positive drops a name that has not been seen before.
+  def __init__(self, capacity, error_rate=0.001):
+    self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    self.hashes = max(1, round(self.size / capacity * math.log(2)))
+    self.bits = bytearray((self.size + 7) // 8)
+
+  def add(self, name):
+    # Returns whether the name has (probably) been added before.
+    digest = hashlib.blake2b(name.encode(), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'little')
+    second = int.from_bytes(digest[8:], 'little') | 1
+    seen = True
+    for i in range(self.hashes):
+      bit = (first + i * second) % self.size
+      mask = 1 << (bit & 7)
+      if not self.bits[bit >> 3] & mask:
+        seen = False
+        self.bits[bit >> 3] |= mask
+    return seen
+
+
+def unique(domains, seen):
+  for domain in domains:
+    if not seen.add(domain.lower().rstrip('.')):
+      yield domain
+
+
+def read_domains(path, column=1, skip=0, limit=None, shard=None, dedup=None):
+  # Streams the domains of the input, nothing is read ahead. The shard is
+  # selected first, skip and limit apply to the (deduplicated) domains.
+  if shard is None:
+    lines = read_lines(path)
+  else:
+    lines = read_shard(path, *shard)
+  domains = (parse_domain(line.decode('utf-8', 'replace'), column) for line in lines)
+  domains = (domain for domain in domains if domain is not None)
+  if dedup is not None:
+    domains = unique(domains, dedup)
+  return itertools.islice(domains, skip, None if limit is None else skip + limit)
@@ -0,0 +1,74 @@
+import bisect
+import io
+import dns.message
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
+import dns.zone
+
+from dnssec.probing.datatypes import *
+from dnssec.probing.exception import *
+from dnssec.probing import files
+
+
+class LocalRoot:
+  # A local copy of the root zone (RFC 8806). It answers the DS, NSEC and NS
+  # lookups of the TLDs, which would otherwise be sent to a root server. The
+  # copy is trusted once its ZONEMD has been validated with the root DNSKEY.
+  def __init__(self, zone):
+    self.zone = zone
+    # NSEC records in canonical order, used to find the one covering a name.
+    self.nsec_owners = sorted(name for name, node in zone.nodes.items()
+                              if node.get_rdataset(dns.rdataclass.IN, dns.rdatatype.NSEC))
+
+  def get(self, name, rdtype):
+    name = dns.name.from_text(name) if isinstance(name, str) else name
+    return Response(self.zone.get_rrset(name, rdtype),
+                    self.zone.get_rrset(name, dns.rdatatype.RRSIG, rdtype))
+
+  def delegation(self, zone_name):
+    return self.zone.get_rrset(dns.name.from_text(zone_name), dns.rdatatype.NS)
+
+  def glue(self, zone_name):
+    # Returns the address of one of the name servers of a TLD.
+    ns = self.delegation(zone_name)
+    for target in sorted(rdata.target for rdata in ns or []):
+      address = self.zone.get_rrset(target, dns.rdatatype.A)
+      if address:
+        return address[0].to_text()
+    return None
+
+  def covering_nsec(self, name):
+    # An index of -1 selects the last record, which wraps around.
+    i = bisect.bisect_right(self.nsec_owners, name) - 1
+    return self.get(self.nsec_owners[i], dns.rdatatype.NSEC)
+
+  def query(self, name, rdtype):
+    # Builds the response a root server would give, either the records with
+    # their signature or the NSEC record proving their absence.
+    qname = dns.name.from_text(name)
+    response = dns.message.make_response(
+        dns.message.make_query(qname, rdtype, want_dnssec=True))
+    answer = self.get(qname, rdtype)
+    if answer.rrset is not None:
+      response.answer.extend(rrset for rrset in [answer.rrset, answer.rrsig] if rrset)
+      return response
+    proof = self.get(qname, dns.rdatatype.NSEC)
+    if proof.rrset is None:
+      proof = self.covering_nsec(qname)
+    response.authority.extend(rrset for rrset in [proof.rrset, proof.rrsig] if rrset)
+    return response
+
+  def verify_digest(self):
+    try:
+      self.zone.verify_digest()
+    except dns.zone.NoDigest:
+      raise RessourceMissingError('ZONEMD')
+    except dns.zone.DigestVerificationFailure:
+      raise ShouldNotHappenError('ZONEMD of the local root zone does not match')
+
+
+def load(path):
+  with io.TextIOWrapper(files.open_read(path)) as zone_file:
+    zone = dns.zone.from_file(zone_file, origin=dns.name.root, relativize=False)
+  return LocalRoot(zone)
@@ -0,0 +1,162 @@
+import base64
+import bisect
+import threading
+
+from collections import OrderedDict
+
+
+# Contains the NSEC3 hashes of names that have been computed before, e.g. a
+# name hashed for the cached ranges and again for the proof of a response.
+# Bounded, the least recently used entries are dropped first.
+# {(str name, bytes salt, int iterations, int algorithm): (str hash, float seconds)}
+nsec3_hashes = OrderedDict()
+nsec3_lock = threading.Lock()
+max_nsec3_hashes = 10000
+
+# Zones whose NSEC3 chain uses more iterations are treated as insecure without
+# hashing anything (RFC 9276, Section 3.2).
+max_nsec3_iterations = 150
+
+# Contains the validated NSEC/NSEC3 records of zones. They are reused to prove
+# the absence of DS records without querying the zone again (RFC 8198).
+denial_ranges = dict()  # {str zone: DenialRanges}
+
+# Translates base32 to base32hex (RFC 4648, Section 7), used by NSEC3.
+b32_to_b32hex = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567',
+                                b'0123456789ABCDEFGHIJKLMNOPQRSTUV')
+
+
+def has_type(rdata, rdtype):
+  # Checks the type bit maps of an NSEC or NSEC3 record (RFC 4034, 4.1.2).
+  window, bit = divmod(rdtype, 256)
+  for current_window, bitmap in rdata.windows:
+    if current_window == window:
+      return bit // 8 < len(bitmap) and bool(bitmap[bit // 8] & (0x80 >> (bit % 8)))
+  return False
+
+
+def owner_hash(rrset):
+  return rrset.name.labels[0].decode().upper()
+
+
+def next_hash(nsec3):
+  return base64.b32encode(nsec3.next).translate(b32_to_b32hex).decode()
+
+
+def covers(owner, next, hashed):
+  if owner < next:
+    return owner < hashed < next
+  # The last record of the chain wraps around to the first one.
+  return hashed > owner or hashed < next
+
+
+def lookup_hash(key):
+  with nsec3_lock:
+    hashed = nsec3_hashes.get(key)
+    if hashed is not None:
+      nsec3_hashes.move_to_end(key)
+    return hashed
+
+
+def store_hash(key, hashed):
+  with nsec3_lock:
+    nsec3_hashes[key] = hashed
+    nsec3_hashes.move_to_end(key)
+    while len(nsec3_hashes) > max_nsec3_hashes:
+      nsec3_hashes.popitem(last=False)
+
+
+def nsec3_params(nsec3):
+  return nsec3.salt, nsec3.iterations, nsec3.algorithm
+
+
+def find_nsec3(hashed, params, rrsets):
+  # Returns the NSEC3 RRset matching the hash, or the one covering it. Records
+  # hashed with other parameters belong to a different chain and are skipped.
+  covering = None
+  for rrset in rrsets:
+    if nsec3_params(rrset[0]) != params:
+      continue
+    owner = owner_hash(rrset)
+    if owner == hashed:
+      return rrset, None
+    if covering is None and covers(owner, next_hash(rrset[0]), hashed):
+      covering = rrset
+  return None, covering
+
+
+def find_rrsig(rrset, rrsigs):
+  for rrsig in rrsigs:
+    if rrsig.name == rrset.name:
+      return rrsig
+  return None
+
+
+def find_nsec(name, rrsets):
+  # Returns the NSEC RRset matching the name, or the one covering it.
+  covering = None
+  for rrset in rrsets:
+    if rrset.name == name:
+      return rrset, None
+    if covering is None and covers(rrset.name, rrset[0].next, name):
+      covering = rrset
+  return None, covering
+
+
+def expiration(rrset, rrsig, now):
+  return min([int(now) + rrset.ttl] + [sig.expiration for sig in rrsig])
+
+
+class DenialRanges:
+  # The ranges between owner and next name (or hash) of the NSEC/NSEC3 records
+  # of one zone, sorted by owner. The range that might cover a name is the one
+  # with the largest owner that is not bigger than the name.
+  def __init__(self, nsec_type, params=None):
+    self.nsec_type = nsec_type
+    self.params = params
+    self.owners = []
+    self.ranges = []  # [(next, bool has_ds, int expiration)]
+    self.lock = threading.Lock()
+
+  def add(self, owner, next, has_ds, expiration):
+    with self.lock:
+      i = bisect.bisect_left(self.owners, owner)
+      if i < len(self.owners) and self.owners[i] == owner:
+        self.ranges[i] = (next, has_ds, expiration)
+      else:
+        self.owners.insert(i, owner)
+        self.ranges.insert(i, (next, has_ds, expiration))
+
+  def proves_absence(self, value, now):
+    # Returns the expiration of the range proving that value has no DS
+    # record, or None.
+    with self.lock:
+      if not self.owners:
+        return None
+      # An index of -1 selects the last record, which wraps around.
+      i = bisect.bisect_right(self.owners, value) - 1
+      owner = self.owners[i]
+      next, has_ds, expiration = self.ranges[i]
+      if expiration < now:
+        del self.owners[i]
+        del self.ranges[i]
+        return None
+    if (not has_ds) if owner == value else covers(owner, next, value):
+      return expiration
+    return None
+
+  def prune(self, now):
+    with self.lock:
+      kept = [i for i, (_, _, expiration) in enumerate(self.ranges) if expiration >= now]
+      self.owners = [self.owners[i] for i in kept]
+      self.ranges = [self.ranges[i] for i in kept]
+      return len(self.owners)
+
+
+def add_denial(zone, nsec_type, params, owner, next, has_ds, expiration):
+  ranges = denial_ranges.get(zone)
+  if ranges is None or ranges.nsec_type != nsec_type or ranges.params != params:
+    # The zone switched its denial of existence (e.g. a new NSEC3 salt).
+    ranges = DenialRanges(nsec_type, params)
+    denial_ranges[zone] = ranges
+  ranges.add(owner, next, has_ds, expiration)
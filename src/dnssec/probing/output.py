@@ -0,0 +1,182 @@
+import itertools
+import queue
+import threading
+import time
+
+from dnssec.probing.datatypes import *
+from dnssec.probing import codec
+from dnssec.probing import files
+
+
+zone_members = ZoneInfo().member_names()
+
+
+class ZoneTable:
+  # Assigns an ID to every distinct ZoneInfo. Zones like '.' or 'com.' are part
+  # of almost every chain, they are written once and referenced by ID after.
+  def __init__(self):
+    self.ids = dict()  # {tuple zone_info: int zone_id}
+
+  def ref(self, zone_info):
+    key = tuple(getattr(zone_info, member) for member in zone_members)
+    zone_id = self.ids.get(key)
+    if zone_id is not None:
+      return zone_id, False
+    zone_id = len(self.ids)
+    self.ids[key] = zone_id
+    return zone_id, True
+
+  def restore(self, zones):
+    for zone_id, zone_info in zones.items():
+      self.ids[tuple(getattr(zone_info, member) for member in zone_members)] = zone_id
+
+
+class JSONLWriter:
+  # Writes one ValidationResult per line. If a zones path is given, the zones
+  # are written to a table of their own and domains only contain 'zone_ids'.
+  # The domains can be compressed and rotated (see files.SegmentedFile). Given
+  # the state of an earlier writer, its files are continued.
+  def __init__(self, path, zones_path=None, compression=None,
+               max_bytes=None, max_records=None, state=None):
+    state = state or dict()
+    self.zones_file = None
+    if zones_path:
+      self.zones = ZoneTable()
+      zone_segments = state.get('zones')
+      if zone_segments:
+        self.zones.restore(read_zones(zones_path, zone_segments[-1]['records']))
+      self.zones_file = files.SegmentedFile(zones_path, compression,
+                                            segments=zone_segments)
+    self.file = files.SegmentedFile(path, compression, max_bytes, max_records,
+                                    state.get('output'))
+
+  def encode_zones(self, result):
+    zone_ids = []
+    for zone_info in result.zones:
+      zone_id, is_new = self.zones.ref(zone_info)
+      if is_new:
+        self.zones_file.write(codec.encode_zone(zone_info, zone_id))
+      zone_ids.append(zone_id)
+    return zone_ids
+
+  def encode(self, result):
+    if self.zones_file is None:
+      return codec.encode_result(result)
+    return codec.encode_result(result, self.encode_zones(result))
+
+  def write(self, result):
+    self.file.write(self.encode(result))
+
+  def write_batch(self, results):
+    if results:
+      self.file.write_records([self.encode(result) for result in results])
+
+  def state(self):
+    state = {'output': self.file.state()}
+    if self.zones_file is not None:
+      state['zones'] = self.zones_file.state()
+    return state
+
+  def flush(self, sync=False):
+    # Zones have to hit the disk before the domains referencing them.
+    if self.zones_file is not None:
+      self.zones_file.flush(sync)
+    self.file.flush(sync)
+
+  def close(self):
+    self.file.close()
+    if self.zones_file is not None:
+      self.zones_file.close()
+
+
+class BackgroundWriter:
+  # Serializes and writes the results of another writer on a separate thread.
+  # Results are handed over through a bounded queue, hence the prober blocks
+  # once the disk falls behind. The output is flushed after batch_size results
+  # or flush_interval seconds, and synced to disk every fsync_interval seconds
+  # or when sync() is called.
+  def __init__(self, writer, queue_size=4096, batch_size=512,
+               flush_interval=1.0, fsync_interval=None):
+    self.writer = writer
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.fsync_interval = fsync_interval
+    self.queue = queue.Queue(queue_size)
+    self.error = None
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def write(self, result):
+    if self.error:
+      raise self.error
+    self.queue.put(result)
+
+  def next_batch(self, deadline):
+    batch = []
+    while len(batch) < self.batch_size:
+      try:
+        result = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+      except queue.Empty:
+        break
+      batch.append(result)
+      if result is None or isinstance(result, threading.Event):
+        break
+    return batch
+
+  def run(self):
+    last_flush = last_sync = time.monotonic()
+    done = False
+    synced = None
+    try:
+      while not done:
+        batch = self.next_batch(last_flush + self.flush_interval)
+        synced = None
+        if batch and batch[-1] is None:
+          batch.pop()
+          done = True
+        elif batch and isinstance(batch[-1], threading.Event):
+          synced = batch.pop()
+        self.writer.write_batch(batch)
+        now = time.monotonic()
+        sync = synced is not None or (self.fsync_interval is not None and
+                                      (done or now - last_sync >= self.fsync_interval))
+        self.writer.flush(sync)
+        last_flush = now
+        if sync:
+          last_sync = now
+        if synced is not None:
+          synced.set()
+    except Exception as e:
+      self.error = e
+      # Keep draining the queue, the prober must not block forever.
+      if synced is not None:
+        synced.set()
+      # The close sentinel may have been part of the failed batch.
+      while not done:
+        result = self.queue.get()
+        if isinstance(result, threading.Event):
+          result.set()
+        done = result is None
+
+  def sync(self):
+    # Blocks until all results written before are flushed and synced.
+    synced = threading.Event()
+    self.queue.put(synced)
+    synced.wait()
+    if self.error:
+      raise self.error
+
+  def close(self):
+    self.queue.put(None)
+    self.thread.join()
+    self.writer.close()
+    if self.error:
+      raise self.error
+
+
+def read_zones(path, limit=None):
+  zones = dict()  # {int zone_id: ZoneInfo}
+  for line in itertools.islice(files.read_lines(path), limit):
+    dct = codec.loads(line)
+    zones[dct['id']] = codec.zone_from_dict(dct)
+  return zones
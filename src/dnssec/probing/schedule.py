@@ -0,0 +1,90 @@
+import heapq
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+
+from operator import itemgetter
+
+
+def suffix_key(domain):
+  # 'www.example.com.' -> 'com example www'. The space sorts before every
+  # character of a host name, so a zone is directly followed by its subtree.
+  return ' '.join(reversed(domain.lower().rstrip('.').split('.')))
+
+
+def write_run(directory, records):
+  fd, path = tempfile.mkstemp(dir=directory)
+  with os.fdopen(fd, 'wb') as run_file:
+    for record in records:
+      pickle.dump(record, run_file, pickle.HIGHEST_PROTOCOL)
+  return path
+
+
+def read_run(path):
+  with open(path, 'rb') as run_file:
+    while True:
+      try:
+        yield pickle.load(run_file)
+      except EOFError:
+        return
+
+
+def sort_by_suffix(domains, chunk_size=1000000):
+  # Yields (input index, domain) ordered by the reversed labels, so that all
+  # domains of a zone are probed while it is cached. Inputs larger than
+  # chunk_size are sorted in chunks on disk and merged.
+  indexed = ((suffix_key(domain), index, domain) for index, domain in enumerate(domains))
+  chunk = sorted(itertools.islice(indexed, chunk_size))
+  if len(chunk) < chunk_size:
+    for _, index, domain in chunk:
+      yield index, domain
+    return
+  directory = tempfile.mkdtemp(prefix='dnssec-sort-')
+  try:
+    runs = []
+    while chunk:
+      runs.append(write_run(directory, chunk))
+      chunk = sorted(itertools.islice(indexed, chunk_size))
+    for _, index, domain in heapq.merge(*[read_run(path) for path in runs]):
+      yield index, domain
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class ResequencingWriter:
+  # Restores the input order of results that have been probed in another
+  # order. Gets (input index, result) tuples, which are buffered and spilled
+  # to sorted runs on disk. The output is only written once it is closed.
+  def __init__(self, writer, buffer_size=100000):
+    self.writer = writer
+    self.buffer_size = buffer_size
+    self.buffer = []  # [(int index, ValidationResult)]
+    self.runs = []
+    self.directory = tempfile.mkdtemp(prefix='dnssec-resequence-')
+
+  def write(self, indexed_result):
+    self.write_batch([indexed_result])
+
+  def write_batch(self, indexed_results):
+    self.buffer.extend(indexed_results)
+    if len(self.buffer) >= self.buffer_size:
+      self.buffer.sort(key=itemgetter(0))
+      self.runs.append(write_run(self.directory, self.buffer))
+      self.buffer = []
+
+  def flush(self, sync=False):
+    pass
+
+  def close(self):
+    self.buffer.sort(key=itemgetter(0))
+    merged = heapq.merge(*[read_run(path) for path in self.runs], self.buffer,
+                         key=itemgetter(0))
+    while True:
+      batch = [result for _, result in itertools.islice(merged, 512)]
+      if not batch:
+        break
+      self.writer.write_batch(batch)
+    self.writer.close()
+    shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,82 @@
+import heapq
+
+
+def zone_key(zone_info):
+  # A DS mismatch or a broken rollover may keep the state but not the flags.
+  return (f'{zone_info.validation_state} {zone_info.validated} {zone_info.has_ds} '
+          f'{zone_info.valid_dnskey} {zone_info.valid_soa} {zone_info.valid_ds}')
+
+
+def result_key(result):
+  # What has to change for a result to be written again. Reasons like
+  # timeouts or hash times vary between probes and are left out.
+  return ' '.join([result.validation_state] +
+                  [f'{zone.name}={zone_key(zone)}' for zone in result.zones])
+
+
+def is_below(domain, zone_name):
+  # Whether the domain is the zone or one of its descendants.
+  name = domain.lower().rstrip('.') + '.'
+  return zone_name == '.' or name == zone_name or name.endswith('.' + zone_name)
+
+
+class Scheduler:
+  # Keeps for every name (domain or zone) when it is due again and the key of
+  # its last result. The heap may contain outdated entries, they are skipped
+  # when they come up.
+  def __init__(self):
+    self.entries = dict()  # {str name: [float due, str key]}
+    self.heap = []  # [(float due, str name)]
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, name):
+    return name in self.entries
+
+  def add(self, name, due=0):
+    # New names are due immediately, known ones keep their due time.
+    if name in self.entries:
+      return False
+    self.schedule(name, due, None)
+    return True
+
+  def schedule(self, name, due, key):
+    self.entries[name] = [due, key]
+    heapq.heappush(self.heap, (due, name))
+
+  def update(self, name, key, due):
+    # Returns whether the key differs from the previous one.
+    changed = self.entries.get(name, [None, None])[1] != key
+    self.schedule(name, due, key)
+    return changed
+
+  def remove(self, name):
+    self.entries.pop(name, None)
+
+  def pop_due(self, now, limit=None):
+    # Returns the names that are due, the earliest first.
+    names = []
+    while self.heap and self.heap[0][0] <= now and (limit is None or len(names) < limit):
+      due, name = heapq.heappop(self.heap)
+      entry = self.entries.get(name)
+      if entry is not None and entry[0] == due:
+        names.append(name)
+    return names
+
+  def next_due(self):
+    while self.heap:
+      due, name = self.heap[0]
+      entry = self.entries.get(name)
+      if entry is not None and entry[0] == due:
+        return due
+      heapq.heappop(self.heap)
+    return None
+
+  def state(self):
+    return self.entries
+
+  def restore(self, entries):
+    self.entries = {name: list(entry) for name, entry in entries.items()}
+    self.heap = [(due, name) for name, (due, _) in self.entries.items()]
+    heapq.heapify(self.heap)
@@ -0,0 +1,111 @@
+import os
+import socketserver
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from dnssec.probing import codec
+
+
+class ValidationHandler(BaseHTTPRequestHandler):
+  # GET /validate?domain=example.com&domain=example.org
+  # POST /validate with a JSON list of domains or {"domains": [...]}
+  # GET /stats
+  # Answers with {"results": [ValidationResult.as_dict()]}, in request order.
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    url = urllib.parse.urlsplit(self.path)
+    if url.path == '/stats':
+      self.send_json(200, self.server.stats())
+    elif url.path == '/validate':
+      self.validate(urllib.parse.parse_qs(url.query).get('domain', []))
+    else:
+      self.send_json(404, {'error': f'unknown path {url.path}'})
+
+  def do_POST(self):
+    url = urllib.parse.urlsplit(self.path)
+    if url.path != '/validate':
+      self.send_json(404, {'error': f'unknown path {url.path}'})
+      return
+    try:
+      body = codec.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+    except ValueError:
+      self.send_json(400, {'error': 'the body is no JSON'})
+      return
+    domains = body.get('domains') if isinstance(body, dict) else body
+    if not isinstance(domains, list) or not all(isinstance(domain, str) for domain in domains):
+      self.send_json(400, {'error': 'expected a list of domains'})
+      return
+    self.validate(domains)
+
+  def validate(self, domains):
+    if not domains:
+      self.send_json(400, {'error': 'no domain given'})
+    elif len(domains) > self.server.max_batch:
+      self.send_json(413, {'error': f'at most {self.server.max_batch} domains per request'})
+    else:
+      try:
+        results = self.server.validate_batch(domains)
+      except Exception as e:
+        # E.g. the root zone could not be validated again.
+        self.send_json(503, {'error': f'{type(e).__name__}: {e}'})
+        return
+      self.send_json(200, {'results': [codec.result_as_dict(result) for result in results]})
+
+  def send_json(self, status, dct):
+    body = codec.dumps(dct)
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def address_string(self):
+    # Unix sockets have no client address.
+    return self.client_address[0] if self.client_address else self.server.server_address
+
+  def log_message(self, format, *args):
+    if self.server.verbose:
+      super().log_message(format, *args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+  def server_bind(self):
+    # HTTPServer.server_bind expects a (host, port) address.
+    socketserver.UnixStreamServer.server_bind(self)
+    self.server_name = self.server_address
+    self.server_port = 0
+
+
+def parse_address(text):
+  # 'HOST:PORT' or ':PORT', which listens on localhost.
+  host, _, port = text.rpartition(':')
+  return host or '127.0.0.1', int(port)
+
+
+def serve(validate_batch, stats, address=None, socket_path=None, max_batch=10000,
+          verbose=False):
+  # Keeps answering requests with validate_batch(domains), which returns one
+  # ValidationResult per domain. The requests are handled by threads of
+  # their own and share the caches of the process.
+  if socket_path is not None:
+    if os.path.exists(socket_path):
+      os.remove(socket_path)
+    server = ThreadingUnixHTTPServer(socket_path, ValidationHandler)
+  else:
+    server = ThreadingHTTPServer(parse_address(address), ValidationHandler)
+  server.validate_batch = validate_batch
+  server.stats = stats
+  server.max_batch = max_batch
+  server.verbose = verbose
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    if socket_path is not None and os.path.exists(socket_path):
+      os.remove(socket_path)
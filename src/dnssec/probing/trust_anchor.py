@@ -0,0 +1,119 @@
+import dns.dnssec
+import dns.exception
+import dns.rrset
+import xml.etree.ElementTree as ElementTree
+import hashlib
+import json
+import os
+import time
+
+from datetime import datetime
+from collections import defaultdict
+from dnssec.probing.datatypes import *
+from dnssec.probing import verification
+
+
+# https://data.iana.org/root-anchors/root-anchors.xml
+default_anchors = ['19036 8 2 49aac11d7b6f6446702e54a1607371607a1a41855200fd2ce1cdde32f24e8fb5',
+                   '20326 8 2 e06d44b80b8f1d39a95c0b0d7c65d08458e880409bbc683457104237c7f8ec8d']
+
+
+def parse_ds_text(line):
+  # Accepts both the bare DS rdata ('20326 8 2 E06D...') and a full
+  # zone file line ('. 172800 IN DS 20326 8 2 E06D...').
+  tokens = line.split()
+  if 'DS' in tokens:
+    tokens = tokens[tokens.index('DS') + 1:]
+  key_tag, algorithm, digest_type = (int(token) for token in tokens[:3])
+  return (key_tag, algorithm), (digest_type, bytes.fromhex(''.join(tokens[3:])))
+
+
+def parse_xml(path, now):
+  anchors = []
+  for key_digest in ElementTree.parse(path).getroot().iter('KeyDigest'):
+    valid_from = key_digest.get('validFrom')
+    valid_until = key_digest.get('validUntil')
+    if valid_from and datetime.fromisoformat(valid_from).timestamp() > now:
+      continue
+    if valid_until and datetime.fromisoformat(valid_until).timestamp() < now:
+      continue
+    anchors.append(' '.join(key_digest.findtext(tag).strip() for tag in
+                            ['KeyTag', 'Algorithm', 'DigestType', 'Digest']))
+  return anchors
+
+
+def load_anchors(path=None):
+  if path is None:
+    lines = default_anchors
+  elif path.endswith('.xml'):
+    lines = parse_xml(path, time.time())
+  else:
+    with open(path, 'r') as anchor_file:
+      lines = [line.split(';')[0].strip() for line in anchor_file]
+  anchors = defaultdict(set)  # {(int key_tag, int algorithm): {(int, bytes)}}
+  for line in lines:
+    if line:
+      key, digest = parse_ds_text(line)
+      anchors[key].add(digest)
+  if not anchors:
+    raise RessourceMissingError(f'trust anchor in {path}')
+  return dict(anchors)
+
+
+def anchors_fingerprint(anchors):
+  digest = hashlib.sha256()
+  for key, digests in sorted(anchors.items()):
+    for digest_type, value in sorted(digests):
+      digest.update(repr((key, digest_type)).encode() + value)
+  return digest.hexdigest()
+
+
+def matches(anchors, zone, keys):
+  # Only keys whose tag and algorithm appear in the anchor are hashed.
+  for key, digests in anchors.items():
+    for dnskey in keys.keys.get(key, []):
+      for digest_type, value in digests:
+        if dns.dnssec.make_ds(zone, dnskey, digest_type).digest == value:
+          return True
+  return False
+
+
+def save_snapshot(path, zone, anchors):
+  dnskey = zone.dnskey
+  snapshot = {'anchors': anchors_fingerprint(anchors),
+              'ns': zone.ns,
+              'expiration': min(rrsig.expiration for rrsig in dnskey.rrsig),
+              'ttl': dnskey.rrset.ttl,
+              'dnskey': [rdata.to_text() for rdata in dnskey.rrset],
+              'rrsig': [rdata.to_text() for rdata in dnskey.rrsig]}
+  # Write atomically, several probing processes may share the same snapshot.
+  tmp_path = f'{path}.{os.getpid()}'
+  with open(tmp_path, 'w') as snapshot_file:
+    json.dump(snapshot, snapshot_file)
+  os.replace(tmp_path, path)
+
+
+def load_snapshot(path, anchors, now=None):
+  # The snapshot is only a cache, its DNSKEY RRset is checked against the
+  # anchors and its own signature again. No query is needed for this.
+  if not os.path.exists(path):
+    return None
+  with open(path, 'r') as snapshot_file:
+    snapshot = json.load(snapshot_file)
+  if now is None:
+    now = time.time()
+  if snapshot['anchors'] != anchors_fingerprint(anchors):
+    return None
+  try:
+    dnskey = Response(
+        dns.rrset.from_text('.', snapshot['ttl'], 'IN', 'DNSKEY', *snapshot['dnskey']),
+        dns.rrset.from_text('.', snapshot['ttl'], 'IN', 'RRSIG', *snapshot['rrsig']))
+  except (dns.exception.DNSException, ValueError):
+    return None
+  if not dnskey.rrsig or min(rrsig.expiration for rrsig in dnskey.rrsig) < now:
+    return None
+  keys = verification.index_keys(dnskey.rrset)
+  if not (verification.verify_rrsigset(dnskey.rrset, dnskey.rrsig, '.', keys, now)
+          and matches(anchors, '.', keys)):
+    return None
+  return Zone('.', dnskey, snapshot['ns'], None, None, keys)
@@ -0,0 +1,216 @@
+import dns.name
+import dns.dnssec
+import hashlib
+import struct
+import threading
+
+from collections import OrderedDict
+from collections import defaultdict
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import ed448
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import utils
+from dnssec.probing.datatypes import KeyIndex
+
+
+# Contains the outcome of RRSIG verifications that have already been done.
+# An entry is valid until the earliest signature of the RRSIG set expires.
+# Bounded, the least recently used entries are dropped first and expired ones
+# every prune_interval seconds.
+verified_rrsigsets = OrderedDict()  # {bytes cache_key: (bool valid, int expiration)}
+verified_lock = threading.Lock()
+max_verified_rrsigsets = 100000
+prune_interval = 60
+last_prune = 0
+
+# Hash functions used by the signature algorithms (RFC 8624). DSA and
+# DSANSEC3SHA1 MUST NOT be validated and are left unsupported, like the
+# default policy of dns.dnssec.validate does.
+algorithm_hashes = {
+    dns.dnssec.Algorithm.RSASHA1: hashes.SHA1,
+    dns.dnssec.Algorithm.RSASHA1NSEC3SHA1: hashes.SHA1,
+    dns.dnssec.Algorithm.RSASHA256: hashes.SHA256,
+    dns.dnssec.Algorithm.RSASHA512: hashes.SHA512,
+    dns.dnssec.Algorithm.ECDSAP256SHA256: hashes.SHA256,
+    dns.dnssec.Algorithm.ECDSAP384SHA384: hashes.SHA384,
+}
+
+rsa_algorithms = {dns.dnssec.Algorithm.RSASHA1,
+                  dns.dnssec.Algorithm.RSASHA1NSEC3SHA1,
+                  dns.dnssec.Algorithm.RSASHA256,
+                  dns.dnssec.Algorithm.RSASHA512}
+ecdsa_curves = {dns.dnssec.Algorithm.ECDSAP256SHA256: (ec.SECP256R1, 32),
+                dns.dnssec.Algorithm.ECDSAP384SHA384: (ec.SECP384R1, 48)}
+
+
+def update_digest(digest, rdataset):
+  digest.update(rdataset.name.to_digestable())
+  digest.update(struct.pack('!HHH', rdataset.rdtype,
+                            rdataset.rdclass, rdataset.covers))
+  for rdata in sorted(rd.to_digestable() for rd in rdataset):
+    digest.update(struct.pack('!H', len(rdata)))
+    digest.update(rdata)
+
+
+def cache_key(rrset, rrsig, zone, keys):
+  # The key is built from the canonical form of all involved RRsets. This way
+  # the same RRset, signature and key always map onto the same entry, no
+  # matter in which order the records have been returned by the server.
+  digest = hashlib.sha256(zone.lower().encode())
+  update_digest(digest, rrset)
+  update_digest(digest, rrsig)
+  digest.update(keys.fingerprint)
+  return digest.digest()
+
+
+def index_keys(dnskey_rrset):
+  # Only zone keys can be used for validating signatures or DS records.
+  fingerprint = hashlib.sha256()
+  update_digest(fingerprint, dnskey_rrset)
+  keys = defaultdict(list)
+  for key in dnskey_rrset:
+    if key.protocol == 3 and key.flags & 0x0100:
+      keys[(dns.dnssec.key_id(key), key.algorithm)].append(key)
+  return KeyIndex(fingerprint.digest(), dict(keys))
+
+
+def lookup(key, now):
+  with verified_lock:
+    entry = verified_rrsigsets.get(key)
+    if entry is None:
+      return None
+    valid, expiration = entry
+    if expiration < now:
+      verified_rrsigsets.pop(key, None)
+      return None
+    verified_rrsigsets.move_to_end(key)
+    return valid
+
+
+def prune(now):
+  global last_prune
+  last_prune = now
+  for key in [key for key, (_, expiration) in verified_rrsigsets.items() if expiration < now]:
+    del verified_rrsigsets[key]
+
+
+def store(key, rrsig, valid, now):
+  # A signature that is not valid YET has to be checked again later on.
+  if not valid and any(sig.inception > now for sig in rrsig):
+    return
+  with verified_lock:
+    verified_rrsigsets[key] = (valid, min(sig.expiration for sig in rrsig))
+    verified_rrsigsets.move_to_end(key)
+    if now - last_prune >= prune_interval:
+      prune(now)
+    while len(verified_rrsigsets) > max_verified_rrsigsets:
+      verified_rrsigsets.popitem(last=False)
+
+
+def load_public_key(dnskey):
+  key = dnskey.key
+  if dnskey.algorithm in rsa_algorithms:
+    if key[0] == 0:
+      exponent_len = struct.unpack('!H', key[1:3])[0]
+      key = key[3:]
+    else:
+      exponent_len = key[0]
+      key = key[1:]
+    exponent = int.from_bytes(key[:exponent_len], 'big')
+    modulus = int.from_bytes(key[exponent_len:], 'big')
+    return rsa.RSAPublicNumbers(exponent, modulus).public_key(default_backend())
+  if dnskey.algorithm in ecdsa_curves:
+    curve, octets = ecdsa_curves[dnskey.algorithm]
+    return ec.EllipticCurvePublicNumbers(
+        int.from_bytes(key[:octets], 'big'),
+        int.from_bytes(key[octets:octets * 2], 'big'),
+        curve()).public_key(default_backend())
+  if dnskey.algorithm == dns.dnssec.Algorithm.ED25519:
+    return ed25519.Ed25519PublicKey.from_public_bytes(key)
+  if dnskey.algorithm == dns.dnssec.Algorithm.ED448:
+    return ed448.Ed448PublicKey.from_public_bytes(key)
+  # Unsupported algorithm (e.g. RSAMD5, DSA or ECCGOST)
+  return None
+
+
+def parse_key(keys, dnskey, key_tag=None):
+  # Keys that could not be parsed are stored as None, so they are not parsed
+  # again.
+  if key_tag is None:
+    key_tag = dns.dnssec.key_id(dnskey)
+  cache_key = (key_tag, dnskey.key)
+  if cache_key in keys.public_keys:
+    return keys.public_keys[cache_key]
+  try:
+    public_key = load_public_key(dnskey)
+  except ValueError:
+    public_key = None
+  keys.public_keys[cache_key] = public_key
+  return public_key
+
+
+def signature_data(rrset, rrsig):
+  # The signed data as defined in RFC 4034, Section 3.1.8.1
+  data = rrsig.to_digestable()[:18] + rrsig.signer.to_digestable()
+  rrname = rrset.name
+  if rrname.is_wild() and rrsig.labels != len(rrname) - 2:
+    return None
+  if len(rrname) - 1 < rrsig.labels:
+    return None
+  elif rrsig.labels < len(rrname) - 1:
+    rrname = dns.name.from_text('*', rrname.split(rrsig.labels + 1)[1])
+  rrfixed = rrname.to_digestable() + struct.pack(
+      '!HHI', rrset.rdtype, rrset.rdclass, rrsig.original_ttl)
+  for rdata in sorted(rd.to_digestable() for rd in rrset):
+    data += rrfixed + struct.pack('!H', len(rdata)) + rdata
+  return data
+
+
+def verify_signature(public_key, algorithm, signature, data):
+  try:
+    if algorithm in rsa_algorithms:
+      public_key.verify(signature, data, padding.PKCS1v15(),
+                        algorithm_hashes[algorithm]())
+    elif algorithm in ecdsa_curves:
+      octets = ecdsa_curves[algorithm][1]
+      signature = utils.encode_dss_signature(
+          int.from_bytes(signature[:octets], 'big'),
+          int.from_bytes(signature[octets:], 'big'))
+      public_key.verify(signature, data, ec.ECDSA(algorithm_hashes[algorithm]()))
+    else:
+      public_key.verify(signature, data)
+  except InvalidSignature:
+    return False
+  return True
+
+
+def verify_rrsigset(rrset, rrsigset, zone, keys, now):
+  # Equivalent to dns.dnssec.validate, but only tries the keys matching the
+  # key tag of a signature and works on the pre-parsed keys.
+  if rrset.name != rrsigset.name:
+    return False
+  signer = dns.name.from_text(zone)
+  for rrsig in rrsigset:
+    if rrsig.signer != signer:
+      continue
+    if rrsig.expiration < now or rrsig.inception > now:
+      continue
+    candidates = keys.keys.get((rrsig.key_tag, rrsig.algorithm))
+    if not candidates:
+      continue
+    data = signature_data(rrset, rrsig)
+    if data is None:
+      continue
+    for key in candidates:
+      public_key = parse_key(keys, key, rrsig.key_tag)
+      if public_key is None:
+        continue
+      if verify_signature(public_key, rrsig.algorithm, rrsig.signature, data):
+        return True
+  return False
@@ -0,0 +1,314 @@
+import hashlib
+import io
+import re
+import time
+import dns.dnssec
+import dns.name
+import dns.rdatatype
+import dns.rrset
+import dns.zone
+
+from collections import Counter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dnssec.probing.datatypes import *
+from dnssec.probing.exception import *
+from dnssec.probing import verification
+from dnssec.probing import files
+from dnssec.probing import nsec
+
+
+def strip_comment(line):
+  if ';' not in line:
+    return line
+  quoted = False
+  for i, char in enumerate(line):
+    if char == '"':
+      quoted = not quoted
+    elif char == ';' and not quoted:
+      return line[:i]
+  return line
+
+
+# Directives that change the records of a file, which are not expanded.
+unsupported_directives = {'$INCLUDE', '$GENERATE'}
+# Tokens which may come between the owner and the type of a record.
+ttl_or_class = re.compile(r'^(\d[\dsmhdw]*|IN|CH|HS|CS|NONE|ANY|CLASS\d+)$', re.IGNORECASE)
+
+
+def record_type(tokens):
+  # The type of a record line, given its tokens after the owner.
+  for token in tokens:
+    if not ttl_or_class.match(token):
+      return token.upper()
+  return None
+
+
+def read_directive(content):
+  directive = content.split()
+  if directive[0].upper() in unsupported_directives:
+    raise ZoneFileError(f'{directive[0]} is not supported')
+  if directive[0].upper() not in ('$ORIGIN', '$TTL'):
+    raise ZoneFileError(f'unknown directive {directive[0]}')
+  return directive[0].upper(), directive[1]
+
+
+def find_zone_name(path):
+  # The owner of the first SOA record, the records are parsed relative to it
+  # unless the file sets an $ORIGIN.
+  origin = dns.name.root
+  parentheses = 0
+  with io.TextIOWrapper(files.open_read(path)) as zone_file:
+    for line in zone_file:
+      content = strip_comment(line).strip()
+      if parentheses == 0 and content.startswith('$'):
+        directive, value = read_directive(content)
+        if directive == '$ORIGIN':
+          origin = dns.name.from_text(value, origin)
+        continue
+      if parentheses == 0 and content and line[0] not in ' \t':
+        tokens = content.split()
+        if record_type(tokens[1:]) == 'SOA':
+          return dns.name.from_text(tokens[0], origin)
+      parentheses += content.count('(') - content.count(')')
+  raise RessourceMissingError('SOA in the zone file')
+
+
+def read_chunks(path, chunk_lines=20000):
+  # Splits a master file into chunks of about chunk_lines lines, which can be
+  # parsed on their own. Chunks only end before a new owner name, so the
+  # records of a name (and its RRSIGs) always end up in the same chunk.
+  # The SOA that ends an AXFR dump is dropped, it repeats the first one.
+  # Yields (str origin, int default_ttl, str text).
+  origin = None
+  default_ttl = None
+  lines = []
+  parentheses = 0
+  last_owner = None
+  seen_soa = False
+  skipping = False
+  with io.TextIOWrapper(files.open_read(path)) as zone_file:
+    for line in zone_file:
+      content = strip_comment(line).strip()
+      if parentheses == 0 and content.startswith('$'):
+        directive, value = read_directive(content)
+        if lines:
+          yield origin, default_ttl, ''.join(lines)
+          lines = []
+        if directive == '$ORIGIN':
+          origin = dns.name.from_text(value, dns.name.from_text(origin or '.')).to_text()
+        else:
+          default_ttl = value
+        continue
+      owner = None
+      if content and line[0] not in ' \t':
+        owner = content.split()[0]
+      if parentheses == 0 and content:
+        tokens = content.split()
+        is_soa = record_type(tokens[1:] if owner is not None else tokens) == 'SOA'
+        skipping = is_soa and seen_soa
+        seen_soa = seen_soa or is_soa
+      if (parentheses == 0 and owner is not None and owner != last_owner
+              and len(lines) >= chunk_lines):
+        yield origin, default_ttl, ''.join(lines)
+        lines = []
+      if owner is not None:
+        last_owner = owner
+      if not skipping:
+        lines.append(line)
+      parentheses += content.count('(') - content.count(')')
+  if lines:
+    yield origin, default_ttl, ''.join(lines)
+
+
+def parse_chunk(origin, default_ttl, text, zone_name):
+  # Parsed as a partial zone, dns.zonefile.read_rrsets is quadratic in the
+  # number of names. The zone has to be named after its SOA, the $ORIGIN of
+  # the file only applies to relative names.
+  if origin is not None:
+    text = f'$ORIGIN {origin}\n{text}'
+  if default_ttl is not None:
+    text = f'$TTL {default_ttl}\n{text}'
+  zone = dns.zone.from_text(text, origin=zone_name, relativize=False, check_origin=False)
+  return [dns.rrset.from_rdata_list(name, rdataset.ttl, rdataset)
+          for name, rdataset in zone.iterate_rdatasets()]
+
+
+def find_apex(path, zone_name, chunk_lines=20000):
+  # Returns the SOA, DNSKEY and their RRSIGs, found in the chunk with the SOA.
+  for chunk in read_chunks(path, chunk_lines):
+    apex = {(rrset.rdtype, rrset.covers): rrset  # {(int rdtype, int covers): RRset}
+            for rrset in parse_chunk(*chunk, zone_name) if rrset.name == zone_name}
+    if (dns.rdatatype.SOA, 0) in apex:
+      return apex
+  raise RessourceMissingError('SOA in the zone file')
+
+
+def link_digest(name):
+  return int.from_bytes(hashlib.blake2b(name, digest_size=16).digest(), 'little')
+
+
+class ChainStats:
+  # Checks an NSEC or NSEC3 chain without keeping it in memory. The owners
+  # and next names of a closed chain are the same set, and in canonical order
+  # every link points forward except the last one, which wraps around to the
+  # first. Both can be summed up per chunk and merged.
+  def __init__(self):
+    self.records = 0
+    self.owners = 0  # sum of the digests of the owners, mod 2^128
+    self.nexts = 0
+    self.wraps = 0
+    self.params = set()  # {(bytes salt, int iterations, int algorithm)}
+
+  def add(self, owner, next, wraps, params=None):
+    self.records += 1
+    self.owners = (self.owners + link_digest(owner)) % 2 ** 128
+    self.nexts = (self.nexts + link_digest(next)) % 2 ** 128
+    if wraps:
+      self.wraps += 1
+    if params is not None:
+      self.params.add(params)
+
+  def merge(self, other):
+    self.records += other.records
+    self.owners = (self.owners + other.owners) % 2 ** 128
+    self.nexts = (self.nexts + other.nexts) % 2 ** 128
+    self.wraps += other.wraps
+    self.params |= other.params
+
+  def complete(self):
+    return (self.records > 0 and self.owners == self.nexts and self.wraps == 1
+            and len(self.params) <= 1)
+
+
+def add_link(chains, rrset):
+  rdata = rrset[0]
+  if rrset.rdtype == dns.rdatatype.NSEC:
+    # Names compare in canonical order (RFC 4034, Section 6.1).
+    owner, next = rrset.name.canonicalize(), rdata.next.canonicalize()
+    chains['NSEC'].add(owner.to_wire(), next.to_wire(), next <= owner)
+  else:
+    # Base32hex hashes compare in the same order as the hashed values.
+    owner, next = nsec.owner_hash(rrset), nsec.next_hash(rdata)
+    chains['NSEC3'].add(owner.encode(), next.encode(), next <= owner,
+                        nsec.nsec3_params(rdata))
+
+
+# These are signed wherever they appear in a zone.
+signed_types = {dns.rdatatype.SOA, dns.rdatatype.DNSKEY, dns.rdatatype.DS,
+                dns.rdatatype.NSEC, dns.rdatatype.NSEC3, dns.rdatatype.NSEC3PARAM}
+
+
+def is_delegation(rrset, apex):
+  return rrset.rdtype == dns.rdatatype.NS and rrset.name != apex
+
+
+def verify_chunk(chunk, apex, keys, now):
+  # Verifies every RRSIG of a chunk with the zone keys. Delegations (NS
+  # below the apex) and names without any signature (glue) are not signed.
+  stats = Counter()
+  chains = {'NSEC': ChainStats(), 'NSEC3': ChainStats()}
+  expiration = None
+  rrsets = parse_chunk(*chunk, apex)
+  signatures = {(rrset.name, rrset.covers): rrset for rrset in rrsets
+                if rrset.rdtype == dns.rdatatype.RRSIG}
+  signed_names = {name for name, _ in signatures}
+  for rrset in rrsets:
+    if rrset.rdtype == dns.rdatatype.RRSIG:
+      continue
+    stats['rrsets'] += 1
+    if rrset.rdtype in (dns.rdatatype.NSEC, dns.rdatatype.NSEC3):
+      add_link(chains, rrset)
+    rrsig = signatures.get((rrset.name, rrset.rdtype))
+    if rrsig is None:
+      if rrset.rdtype in signed_types or (
+              rrset.name in signed_names and not is_delegation(rrset, apex)):
+        stats['unsigned'] += 1
+      continue
+    stats['signed'] += 1
+    if verification.verify_rrsigset(rrset, rrsig, apex.to_text(), keys, now):
+      stats['valid'] += 1
+    else:
+      stats['invalid'] += 1
+    rrset_expiration = min(sig.expiration for sig in rrsig)
+    if expiration is None or rrset_expiration < expiration:
+      expiration = rrset_expiration
+  return stats, chains, expiration
+
+
+def verify_chunks(chunks, apex, keys, now, workers=0):
+  # Hands the chunks to a process pool, keeping only a few of them in flight
+  # so that the memory stays bounded.
+  if workers == 0:
+    for chunk in chunks:
+      yield verify_chunk(chunk, apex, keys, now)
+    return
+  with ProcessPoolExecutor(workers) as pool:
+    pending = deque()
+    for chunk in chunks:
+      pending.append(pool.submit(verify_chunk, chunk, apex, keys, now))
+      if len(pending) >= 2 * workers:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+
+def validate_zonefile(path, workers=0, chunk_lines=20000):
+  # Validates a zone from a master file, e.g. an AXFR or a CZDS dump.
+  # Returns the ZoneInfo of the zone and the statistics of its records.
+  # An unreadable file only fails its own zone, its name stays None when
+  # there is no SOA to take it from.
+  zone_info = ZoneInfo()
+  stats = Counter()
+  now = time.time()
+  try:
+    apex_name = find_zone_name(path)
+    zone_info.name = zone_name = apex_name.to_text()
+    apex = find_apex(path, apex_name, chunk_lines)
+    soa = Response(apex[(dns.rdatatype.SOA, 0)],
+                   apex.get((dns.rdatatype.RRSIG, dns.rdatatype.SOA)))
+    dnskey = Response(apex.get((dns.rdatatype.DNSKEY, 0)),
+                      apex.get((dns.rdatatype.RRSIG, dns.rdatatype.DNSKEY)))
+    zone_info.add_signed(soa)
+    zone_info.add_signed(dnskey)
+    if dnskey.rrset is None:
+      raise DNSSECNotDeployedError('no DNSKEY at the apex')
+    zone_info.has_dnskey = True
+    keys = verification.index_keys(dnskey.rrset)
+    counts = Counter(key.flags for key in dnskey.rrset)
+    zone_info.num_ksk, zone_info.num_zsk = counts[257], counts[256]
+    zone_info.key_algos = intern_tuple(sorted({dns.dnssec.algorithm_to_text(key.algorithm)
+                                               for key in dnskey.rrset}))
+    zone_info.valid_dnskey = bool(dnskey.rrsig) and verification.verify_rrsigset(
+        dnskey.rrset, dnskey.rrsig, zone_name, keys, now)
+    zone_info.valid_soa = bool(soa.rrsig) and verification.verify_rrsigset(
+        soa.rrset, soa.rrsig, zone_name, keys, now)
+
+    chains = {'NSEC': ChainStats(), 'NSEC3': ChainStats()}
+    expiration = None
+    for chunk_stats, chunk_chains, chunk_expiration in verify_chunks(
+            read_chunks(path, chunk_lines), apex_name, keys, now, workers):
+      stats.update(chunk_stats)
+      for nsec_type, chain in chunk_chains.items():
+        chains[nsec_type].merge(chain)
+      if chunk_expiration is not None and (expiration is None or chunk_expiration < expiration):
+        expiration = chunk_expiration
+
+    nsec_type = 'NSEC3' if chains['NSEC3'].records else 'NSEC'
+    chain = chains[nsec_type]
+    stats['nsec_type'] = nsec_type
+    stats['chain_records'] = chain.records
+    stats['chain_complete'] = chain.complete()
+    stats['expiration'] = expiration
+    if nsec_type == 'NSEC3' and len(chain.params) == 1:
+      zone_info.nsec3_iterations = next(iter(chain.params))[1]
+    zone_info.validated = (zone_info.valid_dnskey and zone_info.valid_soa
+                           and stats['invalid'] == 0 and stats['unsigned'] == 0
+                           and chain.complete())
+    if not zone_info.validated:
+      zone_info.validation_state = 'WEIRD_STUFF_HAPPENED'
+      zone_info.reason = (f"{stats['invalid']} invalid, {stats['unsigned']} unsigned RRsets, "
+                          f"{nsec_type} chain {'complete' if chain.complete() else 'broken'}")
+  except Exception as e:
+    zone_info.from_error(e)
+  return zone_info, dict(stats)
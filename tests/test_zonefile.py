@@ -0,0 +1,69 @@
+import dns.dnssec
+import dns.name
+import dns.rdatatype
+import dns.zone
+import pytest
+
+from cryptography.hazmat.primitives.asymmetric import ec
+from dnssec.probing import zonefile
+
+
+def signed_zone_text():
+  # A small NSEC signed zone, written with absolute names like a CZDS dump.
+  zone = dns.zone.from_text('''
+@ 3600 IN SOA ns.example. hostmaster.example. 1 7200 3600 1209600 3600
+@ 3600 IN NS ns.example.
+ns 3600 IN A 192.0.2.1
+www 3600 IN A 192.0.2.2
+sub 3600 IN NS ns.sub
+ns.sub 3600 IN A 192.0.2.3
+''', origin='example.', relativize=False)
+  private_key = ec.generate_private_key(ec.SECP256R1())
+  dnskey = dns.dnssec.make_dnskey(private_key.public_key(), dns.dnssec.Algorithm.ECDSAP256SHA256,
+                                  flags=257)
+  dns.dnssec.sign_zone(zone, keys=[(private_key, dnskey)], lifetime=86400)
+  return zone.to_text(relativize=False)
+
+
+def write(tmp_path, text, name='example.zone'):
+  path = tmp_path / name
+  path.write_text(text)
+  return str(path)
+
+
+@pytest.mark.parametrize('chunk_lines', [20000, 3])
+def test_absolute_names_without_origin(tmp_path, chunk_lines):
+  path = write(tmp_path, signed_zone_text())
+  zone_info, stats = zonefile.validate_zonefile(path, chunk_lines=chunk_lines)
+  assert zone_info.name == 'example.'
+  assert zone_info.validation_state == 'VALIDATED', zone_info.reason
+  assert stats.get('unsigned', 0) == 0 and stats.get('invalid', 0) == 0
+
+
+@pytest.mark.parametrize('chunk_lines', [20000, 3])
+@pytest.mark.parametrize('header', ['', '$ORIGIN example.\n'])
+def test_axfr_trailing_soa(tmp_path, chunk_lines, header):
+  text = signed_zone_text()
+  soa = next(line for line in text.splitlines() if ' SOA ' in line and 'RRSIG' not in line)
+  path = write(tmp_path, header + text + soa + '\n')
+  zone_info, stats = zonefile.validate_zonefile(path, chunk_lines=chunk_lines)
+  assert zone_info.name == 'example.'
+  assert zone_info.validation_state == 'VALIDATED', zone_info.reason
+  assert stats.get('unsigned', 0) == 0
+
+
+def test_unreadable_file_fails_only_itself(tmp_path):
+  broken = write(tmp_path, 'www.example. 3600 IN A 192.0.2.2\n', 'broken.zone')
+  valid = write(tmp_path, signed_zone_text())
+  results = [zonefile.validate_zonefile(path)[0] for path in (broken, valid)]
+  assert results[0].name is None
+  assert results[0].validation_state == 'MISSING_RESSOURCE'
+  assert results[1].validation_state == 'VALIDATED', results[1].reason
+
+
+@pytest.mark.parametrize('directive', ['$INCLUDE other.zone', '$GENERATE 1-10 host$ A 192.0.2.$'])
+def test_unsupported_directives(tmp_path, directive):
+  path = write(tmp_path, signed_zone_text() + directive + '\n')
+  zone_info, _ = zonefile.validate_zonefile(path)
+  assert zone_info.validation_state == 'ZONEFILE_ERROR'
+  assert directive.split()[0] in zone_info.reason